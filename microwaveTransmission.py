@@ -5,8 +5,8 @@ import numpy as np
 
 #Custom classes
 import src.simulate    as sm
-import src.plot        as pl
-import src.measurement as ms
+import src.runner      as rn
+import src.config      as cf
 
 #Default configuration files
 layerFileDef = ('config'+os.sep+'layers'+os.sep+'layers.txt')
@@ -15,20 +15,28 @@ simFileDef   = ('config'+os.sep+'simulation'+os.sep+'simInputs.txt')
 #Default save location
 saveLoc = os.path.abspath('Data')
 plotLoc = os.path.abspath('Plots')
-
-#Default save header
-saveHdr = "%-11s%-26s%-26s%-26s%-26s%-26s%-26s" % ("Freq [GHz]", "P Trans (mean +/- std)", "S Trans (mean +/- std)", "P Refl (mean +/- std)", "S Refl (mean +/- std)", "P Absorb (mean +/- std)", "S Absorb (mean +/- std)")
+#Default result cache location
+cacheLoc = os.path.join(saveLoc, 'cache')
 
 #For now, only ability is to simulate using Hou code
-allowedCmds = ['LF', 'SF', 'DT']
-allowedInst = ['UMich_Reflectometer',
-               'Dick_CoherentSource']
+allowedCmds = ['LF', 'SF', 'DT', 'NC', 'J', 'OF', 'PT', 'NP', 'BP', 'SV', 'CM', 'FT']
 def help(val):
+    #The measurement module is only imported where measured data or its instruments are needed
+    import src.measurement as ms
     print ("\nERROR: could not understand '%s'" % (val))
     print ("Usage: python microwaveTransmission.py -lf [layerFile] -sf [simFile] -nt [1] -sm [HOU]")
-    print ("-lf: layer file(s) that contains the dielectric layer parameters. Default value = %s" % (layerFileDef))
-    print ("-dt: data file(s) that contain tranmission/reflection/absorption vs frequency. File must contain indicator of setup = %s" % (','.join(allowedInst)))
+    print ("-lf: layer file(s), or directories of layer files, that contain the dielectric layer parameters. Default value = %s" % (layerFileDef))
+    print ("-dt: data file(s) that contain tranmission/reflection/absorption vs frequency. File must contain indicator of setup = %s" % (','.join(ms.instruments)))
     print ("-sf: file that contains the simulation inputs. Default value = %s" % (simFileDef))
+    print ("-j: number of layer files to simulate concurrently on a pool of worker processes. Default value = 1")
+    print ("-of: output file format, one of %s. Default value = TXT" % (', '.join(rn.outFormats)))
+    print ("-pt: also write the spectra and band averages of every trial (exact reduction only)")
+    print ("-np: headless mode, which writes the numeric outputs without plotting")
+    print ("-bp: render the plots in a background process once the numeric outputs are written")
+    print ("-sv: run as a server taking JSON-line jobs from stdin, or from the Unix socket at the passed path, with -j worker threads")
+    print ("-cm: score every trial against the -dt data by chi-square, with an optional error for data without errors. Trials are kept in memory, and only written with -pt")
+    print ("-ft: fit the layer parameters with a spread to all -dt data by least squares, with an optional error for data without errors")
+    print ("-nc: do not use the result cache in %s. Results are only cached for runs with a fixed Seed" % (cacheLoc))
     print ("Allowed simulation methods are:")
     print ("'HOU': uses matrix formalism laid out in Hou et al. Not suitable for birefringent stacks")
     sy.exit()
@@ -39,54 +47,170 @@ args = argstr.split('-')[1:]
 layerFiles = []
 dataFiles  = []
 simFile    = simFileDef
+cacheDir   = cacheLoc
+numJobs    = 1
+outFormat  = 'TXT'
+perTrial   = False
+plotMode   = 'FG'
+server     = False
+socketPath = None
+compare    = False
+fit        = False
+sigma      = None
 for arg in args:
     cmd = arg.split()[0]; vals = list(arg.split()[1:])
     if cmd.upper() not in allowedCmds:
         help(cmd)
     if cmd.upper() == 'LF':
-        layerFiles = vals
-        for layerFile in layerFiles:
-            if not os.path.isfile(layerFile):
-                sy.exit("\nERROR: could not find layer file '%s'\n" % (layerFile))
-    elif cmd.upper() == 'SM':
-        simFile = val
+        layerFiles = []
+        for val in vals:
+            if os.path.isdir(val):
+                layerFiles += sorted([os.path.join(val, f) for f in os.listdir(val) if f.endswith('.txt')])
+            elif os.path.isfile(val):
+                layerFiles.append(val)
+            else:
+                sy.exit("\nERROR: could not find layer file '%s'\n" % (val))
+    elif cmd.upper() == 'SF':
+        simFile = vals[0]
         if not os.path.isfile(simFile):
             sy.exit("\nERROR: could not find sim file '%s'\n" % (simFile))
+    elif cmd.upper() == 'J':
+        try:
+            numJobs = int(vals[0])
+        except (IndexError, ValueError):
+            help(cmd)
+    elif cmd.upper() == 'OF':
+        if not len(vals) or vals[0].upper() not in rn.outFormats:
+            help(cmd)
+        outFormat = vals[0].upper()
+    elif cmd.upper() == 'PT':
+        perTrial = True
+    elif cmd.upper() == 'NP':
+        plotMode = None
+    elif cmd.upper() == 'BP':
+        if plotMode is not None:
+            plotMode = 'BG'
+    elif cmd.upper() == 'SV':
+        server = True
+        if len(vals):
+            socketPath = vals[0]
+    elif cmd.upper() == 'CM':
+        compare = True
+        if len(vals):
+            try:
+                sigma = float(vals[0])
+            except ValueError:
+                help(cmd)
+    elif cmd.upper() == 'FT':
+        fit = True
+        if len(vals):
+            try:
+                sigma = float(vals[0])
+            except ValueError:
+                help(cmd)
+    elif cmd.upper() == 'NC':
+        cacheDir = None
     elif cmd.upper() == 'DT':
+        import src.measurement as ms
         dataFiles = vals
         for dataFile in dataFiles:
             if not os.path.isfile(dataFile):
-                sy.exit("\nERROR: could not find data file '%s'\n" % (dataFiles))
-            inst = None
-            for instrument in allowedInst:
-                if instrument in dataFile:
-                    inst = instrument
-            if inst is None:
+                sy.exit("\nERROR: could not find data file '%s'\n" % (dataFile))
+            if ms.findInstrument(dataFile) is None:
                 print ("\nERROR: could not indenfity allowed instrument in passed file '%s' for overplotting" % (dataFile))
                 help(cmd)
 
-#Generate and execute simulation and plotting objects
-sims = [sm.Simulate(layerFile=os.path.abspath(layerFile), simFile=os.path.abspath(simFile)) for layerFile in layerFiles]
-for sim in sims:
-    sim.calc()
+#Serve jobs until the input ends or a shutdown job arrives
+if server:
+    import src.server as sv
+    srv = sv.Server(numJobs, simFile=os.path.abspath(simFile), cacheDir=cacheDir, saveLoc=saveLoc)
+    if socketPath is None:
+        srv.serveStdio()
+    else:
+        srv.serveSocket(socketPath)
+    srv.close()
+    sy.exit()
+
+#Parse the layer files up front, split across the -j worker processes, skipping those with errors
+tables, errors = cf.parser.loadLayers(layerFiles, numJobs)
+for layerFile in errors:
+    print ("\nERROR: skipping layer file. %s" % (errors[layerFile]))
+layerFiles = list(tables.keys())
 
-#Write simulated output to a text file
-fhandles = []
-for i in range(len(layerFiles)):
-    layerFile = layerFiles[i]
-    output    = sims[i].outputs
-    fhandle = layerFile.split('.')[0].split('/')[-1]
-    fhandles.append(fhandle)
-    fname = ('%s%ssimOutput_%s.txt' % (saveLoc, os.sep, fhandle))
-    np.savetxt(fname, np.array(output).T, fmt="%-12.4f", header=saveHdr)
+#Generate and execute simulation objects, writing each simulated output to a text file as it finishes.
+#Nominal runs share the products over layers common to several designs
+try:
+    sims = [sm.Simulate(layerFile=os.path.abspath(layerFile), simFile=os.path.abspath(simFile), cacheDir=cacheDir, keepTrials=perTrial or compare) for layerFile in layerFiles]
+except cf.ConfigError as e:
+    sy.exit("\nERROR: %s\n" % (e))
+sims = rn.Runner(numJobs, saveLoc, outFormat=outFormat, perTrial=perTrial).run(sims)
+for sim in sims:
+    #Report the estimated convergence error on the band-averaged outputs
+    if sim.converged is not None:
+        print ('%s %s after %d of %d trials' % (sim.fhandle, 'converged' if sim.converged else 'did not converge', sim.numTrialsUsed, sim.simInputs["Num Trials"]))
+    #Nominal runs and runs with too few trials have no estimate
+    if sim.simInputs["Num Trials"] < 2:
+        continue
+    for key in sim.convErr:
+        if not np.all(np.isfinite(sim.convErr[key])):
+            continue
+        print ('Estimated convergence error for %s %s (median, 5%%, 95%%) = %.2e, %.2e, %.2e' % ((sim.fhandle, key) + tuple(sim.convErr[key])))
 
 #Gather measured data
-dats = [ms.Measurement(dataFile=os.path.abspath(dataFile)) for dataFile in dataFiles]
+dats = []
+if len(dataFiles):
+    import src.measurement as ms
+    dats = [ms.Measurement(dataFile=os.path.abspath(dataFile)) for dataFile in dataFiles]
 for dat in dats:
     dat.loadData()
+
+#Score every trial against each data set, reporting the best-matching build
+if compare:
+    import src.compare as cm
+    for sim in sims:
+        for dat in dats:
+            try:
+                cmp = cm.Compare(sim, dat, sigma=sigma)
+            except Exception as e:
+                print ("\nERROR: %s" % (str(e).strip()))
+                continue
+            cmp.calc()
+            best = cmp.best()[0]
+            print ('%s vs %s: best trial %d with chi2 = %.3e over %d points, %.1f effective trials' % (sim.fhandle, dat.fhandle, best["trial"], best["chi2"], cmp.numPoints, cmp.numEff))
+            if best["build"] is not None:
+                for label in best["build"]:
+                    print ('    %-24s %.6e' % (label, best["build"][label]))
+            cmp.write('%s%scompare_%s_%s.npz' % (saveLoc, os.sep, sim.fhandle, dat.fhandle))
+
+#Fit the layers of each stack to all data sets together, writing the fitted stack as a layer file
+if fit:
+    import src.fit as ft
+    for sim in sims:
+        try:
+            fitter = ft.Fit(sim, dats, sigma=sigma)
+            fitter.calc()
+        except Exception as e:
+            print ("\nERROR: %s" % (str(e).strip()))
+            continue
+        print ('%s fit: chi2 = %.3e over %d degrees of freedom from %d starts' % (sim.fhandle, fitter.chi2, fitter.dof, len(fitter.starts)))
+        results = fitter.results()
+        for label in results:
+            print ('    %-24s %.6e +/- %.2e' % ((label,) + results[label]))
+        fitter.writeLayers('%s%sfit_%s.txt' % (saveLoc, os.sep, sim.fhandle))
+
+#Nothing else to do in headless mode
+if plotMode is None:
+    sy.exit()
+
+#The plotting module, and matplotlib with it, is only loaded when plotting
+import src.plot        as pl
 #fhandles = fhandles + [dataFile.split('.')[0].split('/')[-1] for dataFile in dataFiles]
 
 #Plot all data
-plt = pl.Plot(sims, dats, saveLoc=plotLoc)
-plt.plotTrans()
-plt.plotRefl()
+if plotMode == 'BG':
+    proc = pl.plotBackground(sims, dats, saveLoc=plotLoc)
+    print ('Rendering plots in background process %d' % (proc.pid))
+else:
+    plt = pl.Plot(sims, dats, saveLoc=plotLoc)
+    plt.plotTrans()
+    plt.plotRefl()
@@ -0,0 +1,146 @@
+#Using python 2.7.2
+import numpy       as np
+import collections as cl
+
+#Custom classes
+import src.hou as ho
+
+#Class for evaluating a batch of Simulate objects together. Nominal runs (Num Trials = 1) of the Hou engine
+#on the same frequency grid and incident angle are planned jointly: their mean stacks are inserted into
+#tries of leading and trailing layers, and the products of the element matrices over every prefix or
+#suffix shared by two or more designs are computed once. Every other run is evaluated on its own
+class Batch:
+    def __init__(self, sims):
+        #Store passed parameters
+        self.sims = sims
+        #Number of element matrices evaluated, and the number that independent runs would have needed
+        self.numElements = 0
+        self.numElementsIndep = 0
+
+    # ***** Public Methods *****
+    def calc(self):
+        for sim in self.calcShared():
+            sim.calc()
+        return True
+
+    #Evaluate the cached runs and the nominal runs that share layers with another, returning the runs left to evaluate
+    def calcShared(self):
+        groups = cl.OrderedDict({})
+        left = []
+        for sim in self.sims:
+            if sim.loadCache():
+                continue
+            if self.__shareable(sim):
+                key = (sim.freqs.tobytes(), float(sim.simInputs["Inc Angle"].getAvg()))
+                groups.setdefault(key, []).append(sim)
+            else:
+                left.append(sim)
+        for key in groups:
+            if len(groups[key]) == 1:
+                left.append(groups[key][0])
+            else:
+                self.__calcGroup(groups[key])
+        #Keep the passed order
+        return [sim for sim in self.sims if sim in left]
+
+    # ***** Private Methods *****
+    def __shareable(self, sim):
+        return (sim.simInputs["Sim Method"].upper() == 'HOU' and sim.simInputs["Num Trials"] == 1
+                and not sim.layers.repeats)
+
+    #Trie node as [number of designs through the node, children keyed by layer, stored product or None]
+    def __node(self):
+        return [0, {}, None]
+
+    def __calcGroup(self, sims):
+        freqs  = sims[0].freqs
+        incAng = sims[0].simInputs["Inc Angle"].getAvg()
+        #Mean stacks as lists of (index, thickness, loss tangent) layers
+        stacks = []
+        for sim in sims:
+            thicks, indexes, lossTans = sim.layers.getAvg()
+            stacks.append([(float(indexes[i]), float(thicks[i]), float(lossTans[i])) for i in range(len(thicks))])
+
+        #Prefix trie from the incident side, and suffix tries from the exit side for each Snell invariant,
+        #which sets the angle in every layer
+        prefRoot = self.__node()
+        sufRoots = {}
+        for stack in stacks:
+            node = prefRoot
+            for layer in stack:
+                node = node[1].setdefault(layer, self.__node())
+                node[0] += 1
+            node = sufRoots.setdefault(stack[0][0]*np.sin(incAng), self.__node())
+            for layer in stack[::-1]:
+                node = node[1].setdefault(layer, self.__node())
+                node[0] += 1
+
+        for sim, stack in zip(sims, stacks):
+            numLayers = len(stack)
+            snell = stack[0][0]*np.sin(incAng)
+            n   = np.array([layer[0] for layer in stack])
+            d   = np.array([layer[1] for layer in stack])
+            lt  = np.array([layer[2] for layer in stack])
+            cos = np.cos(np.arcsin(snell/n))
+            #No propagation through the incident medium
+            d[0] = 0.
+            #Element j is propagation through layer j followed by interface j
+            def element(j):
+                self.numElements += 1
+                return ho.elements(n[j:j+1], cos[j:j+1], d[j:j+1], lt[j:j+1], n[j+1:j+2], cos[j+1:j+2], freqs)[0]
+            self.numElementsIndep += numLayers - 1
+
+            #Deepest shared prefix and suffix. The suffix never reaches the incident medium, whose element
+            #differs from that of the same layer further into another design
+            pathP = self.__path(prefRoot, stack)
+            pathS = self.__path(sufRoots[snell], stack[::-1])
+            numP = self.__shared(pathP)
+            numS = min(self.__shared(pathS), numLayers - max(numP, 1))
+            numS = max(numS, 0)
+
+            #Prefix over layers [0, numP) covers elements [0, numP - 1), extended from the deepest stored product
+            M = None
+            for k in range(numP):
+                if pathP[k][2] is not None:
+                    M = pathP[k][2]
+                elif k > 0:
+                    E = element(k-1)
+                    M = E if M is None else ho.mul2(M, E)
+                    pathP[k][2] = M
+            #Middle elements evaluated only for this design
+            for j in range(max(numP - 1, 0), numLayers - 1 - max(numS - 1, 0)):
+                E = element(j)
+                M = E if M is None else ho.mul2(M, E)
+            #Suffix over layers [numLayers - numS, numLayers) covers elements [numLayers - numS, numLayers - 1)
+            S = None
+            for k in range(numS):
+                if pathS[k][2] is not None:
+                    S = pathS[k][2]
+                elif k > 0:
+                    E = element(numLayers - 1 - k)
+                    S = E if S is None else ho.mul2(E, S)
+                    pathS[k][2] = S
+            if M is None:
+                M = S
+            elif S is not None:
+                M = ho.mul2(M, S)
+
+            outs = np.array(ho.spectra(M))[:,np.newaxis]
+            sim.setTrials(outs)
+            sim.saveCache()
+
+    #Trie nodes along a design's layers
+    def __path(self, root, layers):
+        path = []
+        node = root
+        for layer in layers:
+            node = node[1][layer]
+            path.append(node)
+        return path
+
+    #Number of leading nodes on a path shared by two or more designs
+    def __shared(self, path):
+        num = 0
+        while num < len(path) and path[num][0] >= 2:
+            num += 1
+        return num
@@ -0,0 +1,104 @@
+#Using python 2.7.2
+import numpy     as np
+import hashlib   as hl
+import json      as js
+import threading as th
+import           os
+
+#Class for a content-addressed on-disk cache of simulation results. Each entry is a compressed
+#.npz file named by the hash of the inputs, and the least recently used entries are evicted
+#once the cache grows past maxBytes
+class Cache:
+    def __init__(self, cacheDir, maxBytes=2**30):
+        #Store passed parameters
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.__ext = '.npz'
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir)
+
+    # ***** Public Methods *****
+    #Hash of a nested structure of strings, numbers, arrays, and objects exposing their values through __dict__
+    def key(self, *parts):
+        return hl.sha256(js.dumps(self.__canon(parts), sort_keys=True).encode('utf-8')).hexdigest()
+
+    #Dictionary of arrays stored under key, or None on a miss
+    def load(self, key):
+        fname = self.__fname(key)
+        try:
+            with np.load(fname) as f:
+                ret = {k: f[k] for k in f.files}
+        except (IOError, OSError, ValueError):
+            return None
+        #Mark the entry as recently used
+        try:
+            os.utime(fname, None)
+        except OSError:
+            pass
+        return ret
+
+    #Store a dictionary of arrays under key
+    def save(self, key, arrays):
+        fname = self.__fname(key)
+        #Write to a temporary file and move it into place so that readers never see a partial entry.
+        #The name is unique to the writing process and thread
+        tmp = '%s.%d.%d.tmp' % (fname, os.getpid(), th.get_ident())
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp, fname)
+        self.__evict()
+
+    #Remove all entries
+    def clear(self):
+        for fname in self.__entries():
+            os.remove(fname)
+
+    # ***** Private Methods *****
+    def __fname(self, key):
+        return os.path.join(self.cacheDir, key+self.__ext)
+
+    def __entries(self):
+        return [os.path.join(self.cacheDir, f) for f in os.listdir(self.cacheDir) if f.endswith(self.__ext)]
+
+    #Delete the least recently used entries until the cache fits within maxBytes
+    def __evict(self):
+        entries = []
+        for fname in self.__entries():
+            try:
+                st = os.stat(fname)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, fname))
+        entries.sort()
+        total = sum([e[1] for e in entries])
+        for mtime, size, fname in entries:
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+            total -= size
+
+    #JSON-able form of a value, with floats kept at full precision
+    def __canon(self, val):
+        if isinstance(val, dict):
+            return {str(k): self.__canon(v) for k, v in val.items()}
+        elif isinstance(val, (list, tuple)):
+            return [self.__canon(v) for v in val]
+        elif isinstance(val, np.ndarray):
+            return [str(val.dtype), list(val.shape), [self.__canon(v) for v in val.ravel().tolist()]]
+        elif isinstance(val, (bool, np.bool_)) or val is None:
+            return val
+        elif isinstance(val, (int, np.integer)):
+            return int(val)
+        elif isinstance(val, (float, np.floating)):
+            return repr(float(val))
+        elif isinstance(val, str):
+            return val
+        elif isinstance(val, type):
+            return repr(val)
+        elif hasattr(val, '__dict__'):
+            return [type(val).__name__, self.__canon({k: v for k, v in vars(val).items() if not k.startswith('_')})]
+        else:
+            return repr(val)
@@ -0,0 +1,139 @@
+#Using python 2.7.2
+import numpy       as np
+import collections as cl
+
+#Custom classes
+import src.unit as un
+
+#Measured value and error compared with each output along the leading axis of the per-trial arrays
+pairs = [('ptrans', 'ptranserr'), ('strans', 'stranserr'),
+         ('prefl',  'preflerr'),  ('srefl',  'sreflerr'),
+         ('pabso',  'pabsoerr'),  ('sabso',  'sabsoerr')]
+
+#Class for comparing every Monte Carlo trial of a Simulate object, run with keepTrials, against one or more
+#Measurement objects. Each trial is linearly interpolated onto the measured frequencies of every measured
+#output and scored by its chi-square against the measured errors. Points outside the simulated band are
+#left out. Outputs measured without errors are compared with an error of sigma, if passed
+class Compare:
+    def __init__(self, sim, dats, sigma=None, chunkElems=2**24):
+        if sim.trials is None:
+            raise Exception("MICROWAVE TRANSMISSION ERROR: Compare needs the spectra of every trial. Run the simulation with keepTrials and the exact reduction")
+        #Store passed parameters
+        self.sim   = sim
+        self.dats  = dats if isinstance(dats, (list, tuple)) else [dats]
+        self.sigma = sigma
+        #Bound on the size of the (points, trials) arrays of interpolated trials
+        self.chunkElems = chunkElems
+
+        #Measured points, as the trial output, the interpolation interval and weight, the value, and the inverse error
+        self.freqs = sim.freqs*un.Hz_to_GHz
+        rows = []; inds = []; wts = []; vals = []; invErrs = []
+        for dat in self.dats:
+            for row, (val, err) in enumerate(pairs):
+                if getattr(dat, val, None) is None:
+                    continue
+                freq = np.asarray(dat.freq, dtype=np.float64)
+                value = np.asarray(getattr(dat, val), dtype=np.float64)
+                if getattr(dat, err) is not None:
+                    error = np.asarray(getattr(dat, err), dtype=np.float64)
+                elif sigma is not None:
+                    error = np.full(len(freq), float(sigma))
+                else:
+                    raise Exception("MICROWAVE TRANSMISSION ERROR: Measurement '%s' has no errors on '%s'. Pass sigma to Compare" % (dat.fhandle, val))
+                mask = ((freq >= self.freqs[0]) * (freq <= self.freqs[-1]) * np.isfinite(value) * np.isfinite(error) * (error > 0.))
+                ind, wt = self.__interval(freq[mask])
+                rows.append(np.full(len(ind), row)); inds.append(ind); wts.append(wt)
+                vals.append(value[mask]); invErrs.append(1./error[mask])
+        if not len(rows) or not sum([len(ind) for ind in inds]):
+            raise Exception("MICROWAVE TRANSMISSION ERROR: No measured points within the simulated band of '%s'" % (sim.fhandle))
+        self.__rows    = np.concatenate(rows)
+        self.__inds    = np.concatenate(inds)
+        self.__wts     = np.concatenate(wts)
+        self.vals      = np.concatenate(vals)
+        self.__invErrs = np.concatenate(invErrs)
+        self.numPoints = len(self.vals)
+
+        #Per-trial chi-square and likelihood weights, set by calc()
+        self.chi2    = None
+        self.weights = None
+        self.numEff  = None
+
+    # ***** Public Methods *****
+    #Score every trial, returning the chi-square of each
+    def calc(self):
+        trials = self.sim.trials
+        numTrials = trials.shape[1]
+        self.chi2 = np.empty(numTrials)
+        for start, stop in self.__chunks(numTrials):
+            resid = (self.__interp(trials[:, start:stop]) - self.vals[:,np.newaxis])*self.__invErrs[:,np.newaxis]
+            self.chi2[start:stop] = np.sum(resid**2, axis=0)
+        #Likelihood of each trial, relative to the best, and the effective number of trials they weight
+        wts = np.exp(-0.5*(self.chi2 - np.amin(self.chi2)))
+        self.weights = wts/np.sum(wts)
+        self.numEff = 1./np.sum(self.weights**2)
+        return self.chi2
+
+    #Chi-square per measured point
+    def redChi2(self):
+        return self.chi2/self.numPoints
+
+    #Best-matching trials, as a list of dictionaries of the trial, its chi-square, and, where the sampled layers
+    #were kept, its build keyed as in Simulate.sampleLabels()
+    def best(self, num=1):
+        if self.chi2 is None:
+            self.calc()
+        ret = []
+        for ind in np.argsort(self.chi2, kind='stable')[:num]:
+            build = None
+            if self.sim.samples is not None:
+                build = cl.OrderedDict(zip(self.sim.sampleLabels(), self.sim.samples[ind].tolist()))
+            ret.append({"trial": int(ind), "chi2": float(self.chi2[ind]), "build": build})
+        return ret
+
+    #Likelihood-weighted mean and standard deviation of the trial spectra, each of shape (outputs, freqs)
+    def weighted(self):
+        if self.weights is None:
+            self.calc()
+        trials = self.sim.trials
+        mean = np.zeros((trials.shape[0], trials.shape[2])); sq = np.zeros(mean.shape)
+        for start, stop in self.__chunks(trials.shape[1]):
+            wts = self.weights[start:stop]
+            mean += np.tensordot(trials[:, start:stop], wts, axes=([1], [0]))
+            sq   += np.tensordot(trials[:, start:stop]**2, wts, axes=([1], [0]))
+        return mean, np.sqrt(np.maximum(sq - mean**2, 0.))
+
+    #Trial spectra interpolated onto the measured points, shape (points, trials) for a list of trial indices
+    def model(self, inds):
+        return self.__interp(self.sim.trials[:, np.asarray(inds)])
+
+    #Write the chi-square and weight of every trial, the sampled layers where kept, and the weighted spectra to an npz archive
+    def write(self, fname):
+        mean, std = self.weighted()
+        arrays = {"chi2": self.chi2, "weights": self.weights, "numPoints": np.array(self.numPoints),
+                  "freq": self.freqs, "weightedMean": mean, "weightedStd": std}
+        if self.sim.samples is not None:
+            arrays["samples"] = self.sim.samples
+            arrays["sampleLabels"] = np.array(self.sim.sampleLabels())
+        np.savez(fname, **arrays)
+        return fname
+
+    # ***** Private Methods *****
+    #Simulated frequency interval holding each measured frequency, and the linear interpolation weight within it
+    def __interval(self, freq):
+        if len(self.freqs) == 1:
+            return np.zeros(len(freq), dtype=int), np.zeros(len(freq))
+        ind = np.clip(np.searchsorted(self.freqs, freq, side='right') - 1, 0, len(self.freqs) - 2)
+        return ind, (freq - self.freqs[ind])/(self.freqs[ind+1] - self.freqs[ind])
+
+    #(outputs, trials, freqs) spectra linearly interpolated onto the measured points, shape (points, trials)
+    def __interp(self, trials):
+        if trials.shape[2] == 1:
+            return trials[self.__rows, :, 0]
+        lo = trials[self.__rows, :, self.__inds]
+        hi = trials[self.__rows, :, self.__inds+1]
+        return lo + (hi - lo)*self.__wts[:,np.newaxis]
+
+    #Blocks of trials whose interpolated spectra fit within chunkElems
+    def __chunks(self, numTrials):
+        size = max(1, self.chunkElems//self.numPoints)
+        return [(start, min(start + size, numTrials)) for start in range(0, numTrials, size)]
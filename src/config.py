@@ -0,0 +1,185 @@
+#Using python 2.7.2
+import numpy              as np
+import collections        as cl
+import concurrent.futures as cf
+import threading          as th
+import glob               as gb
+import                       os
+
+#Exception for a malformed configuration file or input, naming the file and line where known
+class ConfigError(Exception):
+    def __init__(self, message, fname=None, line=None):
+        Exception.__init__(self, message, fname, line)
+        self.message = message
+        self.fname   = fname
+        self.line    = line
+
+    def __str__(self):
+        if self.fname is None:
+            return self.message
+        elif self.line is None:
+            return '%s: %s' % (self.fname, self.message)
+        else:
+            return '%s, line %d: %s' % (self.fname, self.line, self.message)
+
+#Typed value of a table cell: a (mean, spread) tuple for 'mean +/- spread', an integer or float, an array for
+#'[a, b, ...]', or otherwise the string itself, such as 'NA' or 'HOU'
+def value(text):
+    text = text.strip()
+    if '+/-' in text:
+        avg, std = text.split('+/-', 1)
+        return (value(avg), value(std))
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    if text.startswith('[') and text.endswith(']'):
+        try:
+            return np.array([float(val) for val in text[1:-1].split(',') if val.strip()])
+        except ValueError:
+            pass
+    return text
+
+#Rows of a '|'-delimited table as (line number, cells). As in the np.loadtxt parsing this replaces, text from
+#'+-' on is a border or comment
+def readTable(fname):
+    rows = []
+    try:
+        with open(fname) as f:
+            lines = f.readlines()
+    except (IOError, OSError) as e:
+        raise ConfigError('could not read file (%s)' % (e.strerror), fname)
+    for num, line in enumerate(lines, 1):
+        line = line.split('+-')[0].strip()
+        if not line:
+            continue
+        cells = line.split('|')
+        if len(cells) < 3 or cells[0].strip() or cells[-1].strip():
+            raise ConfigError("row must start and end with '|'", fname, num)
+        rows.append((num, [cell.strip() for cell in cells[1:-1]]))
+    return rows
+
+#Layer file as (name, thickness [mm], index, loss tangent [1e-4]) rows of typed values, below the header row
+def readLayers(fname):
+    ret = []
+    for num, cells in readTable(fname)[1:]:
+        if len(cells) != 4:
+            raise ConfigError('expected 4 columns (layer, thickness, index, loss tangent), found %d' % (len(cells)), fname, num)
+        row = [cells[0]]
+        for cell in cells[1:]:
+            val = value(cell)
+            for part in (val if isinstance(val, tuple) else (val,)):
+                if isinstance(part, str) and 'NA' not in part.upper():
+                    raise ConfigError("could not parse '%s' as a number" % (cell), fname, num)
+            row.append(val)
+        ret.append(tuple(row))
+    if len(ret) < 2:
+        raise ConfigError('at least two layers are needed', fname)
+    return ret
+
+#Simulation file as an ordered dictionary of typed values keyed by parameter, below the header row
+def readSimInputs(fname):
+    ret = cl.OrderedDict({})
+    for num, cells in readTable(fname)[1:]:
+        if len(cells) < 3:
+            raise ConfigError('expected at least 3 columns (parameter, units, value), found %d' % (len(cells)), fname, num)
+        if cells[0] in ret:
+            raise ConfigError("parameter '%s' given twice" % (cells[0]), fname, num)
+        ret[cells[0]] = value(cells[2])
+    return ret
+
+#Parse a layer file, returning its modification stamp and rows, or None and the error. Run in the worker processes of Parser.loadLayers()
+def tryLayers(fname):
+    try:
+        stamp = Parser.stamp(fname)
+        return stamp, readLayers(fname)
+    except ConfigError as e:
+        return None, e
+
+#Class for parsing configuration files once per version. Each parsed file is kept, keyed by its absolute
+#path and checked against its modification time and size on every lookup, so edited files are re-read
+class Parser:
+    def __init__(self, maxEntries=4096):
+        self.maxEntries = maxEntries
+        #Parsed tables keyed by (kind, path), as (stamp, table)
+        self.__tables = cl.OrderedDict({})
+        self.__lock = th.Lock()
+        #Counters
+        self.numParsed = 0
+        self.numHits = 0
+
+    # ***** Public Methods *****
+    #Modification time and size of a file, which identify its version
+    @staticmethod
+    def stamp(fname):
+        try:
+            st = os.stat(fname)
+        except OSError as e:
+            raise ConfigError('could not read file (%s)' % (e.strerror), fname)
+        return (st.st_mtime_ns, st.st_size)
+
+    #Rows of a layer file, as returned by readLayers()
+    def layers(self, fname):
+        return self.__get('LAYERS', fname, readLayers)
+
+    #Inputs of a simulation file, as returned by readSimInputs()
+    def simInputs(self, fname):
+        return self.__get('SIM', fname, readSimInputs)
+
+    #Parse many layer files, splitting the files across numProcs worker processes. Returns ordered dictionaries
+    #of the rows of each file that parsed and the ConfigError of each file that did not, both keyed by the passed names
+    def loadLayers(self, fnames, numProcs=1):
+        fnames = list(fnames)
+        paths = [os.path.abspath(fname) for fname in fnames]
+        if numProcs > 1 and len(paths) > 1:
+            with cf.ProcessPoolExecutor(numProcs) as pool:
+                loaded = list(pool.map(tryLayers, paths, chunksize=max(1, len(paths)//(4*numProcs))))
+        else:
+            loaded = [tryLayers(path) for path in paths]
+        tables = cl.OrderedDict({}); errors = cl.OrderedDict({})
+        for fname, path, (stamp, ret) in zip(fnames, paths, loaded):
+            if stamp is None:
+                errors[fname] = ret
+            else:
+                self.__store(('LAYERS', path), stamp, ret)
+                tables[fname] = ret
+        return tables, errors
+
+    #Parse every layer file in a directory matching pattern, as loadLayers()
+    def loadDir(self, dirName, pattern='*.txt', numProcs=1):
+        return self.loadLayers(sorted(gb.glob(os.path.join(dirName, pattern))), numProcs)
+
+    #Forget every parsed file
+    def clear(self):
+        with self.__lock:
+            self.__tables.clear()
+
+    # ***** Private Methods *****
+    def __get(self, kind, fname, read):
+        path = os.path.abspath(fname)
+        stamp = self.stamp(path)
+        key = (kind, path)
+        with self.__lock:
+            entry = self.__tables.get(key)
+            if entry is not None and entry[0] == stamp:
+                self.__tables.move_to_end(key)
+                self.numHits += 1
+                return entry[1]
+        table = read(path)
+        self.__store(key, stamp, table)
+        return table
+
+    def __store(self, key, stamp, table):
+        with self.__lock:
+            self.numParsed += 1
+            self.__tables[key] = (stamp, table)
+            self.__tables.move_to_end(key)
+            while len(self.__tables) > self.maxEntries:
+                self.__tables.popitem(last=False)
+
+#Parser shared by every Layers and Simulate object
+parser = Parser()
@@ -0,0 +1,212 @@
+#Using python 2.7.2
+import numpy              as np
+import collections        as cl
+import concurrent.futures as cf
+
+#Custom classes
+import src.hou     as ho
+import src.unit    as un
+import src.layers  as ly
+import src.compare as cm
+
+#Layer parameters, in the order of the columns of the sampled trials of a Simulate object
+params = ["Thickness", "Index", "LossTan"]
+
+#Run one local least-squares solve of a Fit object from a starting point. Run in the worker processes of Fit.calc()
+def fitStart(args):
+    fit, x0 = args
+    return fit.solve(x0)
+
+#Class for fitting the free layer parameters of a Simulate object's stack to one or more Measurement objects by
+#weighted least squares. Free parameters are those passed by name, as in Simulate.sampleLabels(), or by default
+#every layer parameter with a nonzero spread, which also sets its scale. The global search draws a population of
+#candidate stacks from the parameter distributions and scores it in batched engine calls, then runs local
+#trust-region solves from the best numStarts candidates, split across the simulation's Num Procs processes.
+#Each Jacobian is a forward difference evaluated as one batch of perturbed stacks. Measured outputs without
+#errors are weighted by an error of sigma, if passed
+class Fit:
+    def __init__(self, sim, dats, free=None, sigma=None, numStarts=8, numCandidates=256):
+        if sim.simInputs["Sim Method"].upper() != 'HOU':
+            raise Exception("MICROWAVE TRANSMISSION ERROR: Fit only supports the 'HOU' simulation method")
+        #Store passed parameters
+        self.layers        = sim.layers
+        self.dats          = dats if isinstance(dats, (list, tuple)) else [dats]
+        self.sigma         = sigma
+        self.numStarts     = max(1, int(numStarts))
+        self.numCandidates = max(self.numStarts, int(numCandidates))
+        self.numProcs      = max(1, sim.simInputs["Num Procs"])
+        self.seed          = sim.simInputs["Seed"]
+        self.incAngle      = sim.simInputs["Inc Angle"].getAvg()
+        self.fhandle       = sim.fhandle
+        #Bound on the (stacks, freqs) size of each engine call
+        self.__batchElems = 2**18
+
+        #Nominal stack as a (3, layers) array of thicknesses, indexes, and loss tangents
+        self.nominal = np.array(self.layers.getAvg(), dtype=np.float64)
+        names = [str(name).strip() for name in self.layers.layers]
+        allLabels = ['%s %s' % (name, param) for name in names for param in params]
+        if free is None:
+            free = [allLabels[i] for i in range(len(allLabels)) if self.__param(i).getStd() > 0.]
+        if not len(free):
+            raise Exception("MICROWAVE TRANSMISSION ERROR: No free parameters to fit. Give parameters a spread or pass them by name")
+        for label in free:
+            if label not in allLabels:
+                raise Exception("MICROWAVE TRANSMISSION ERROR: Free parameter '%s' not understood. Allowed values = %s" % (label, ', '.join(allLabels)))
+        #Free parameters as positions in the flattened (layers, 3) stack, in the order passed
+        self.labels = list(free)
+        self.__free = np.array([allLabels.index(label) for label in self.labels])
+        freeParams = [self.__param(i) for i in self.__free]
+        self.lower = np.array([param.min for param in freeParams], dtype=np.float64)
+        self.upper = np.array([param.max for param in freeParams], dtype=np.float64)
+        #Scale of each free parameter, from its spread or otherwise its size
+        self.scale = np.array([param.getStd() if param.getStd() > 0. else max(abs(param.getAvg()), 1.e-06) for param in freeParams])
+
+        #Measured points, as the output, the index into the measured frequencies, the value, and the inverse error
+        rows = []; finds = []; vals = []; invErrs = []
+        freqs = np.unique(np.concatenate([np.asarray(dat.freq, dtype=np.float64) for dat in self.dats]))
+        for dat in self.dats:
+            freq = np.asarray(dat.freq, dtype=np.float64)
+            for row, (val, err) in enumerate(cm.pairs):
+                if getattr(dat, val, None) is None:
+                    continue
+                value = np.asarray(getattr(dat, val), dtype=np.float64)
+                if getattr(dat, err) is not None:
+                    error = np.asarray(getattr(dat, err), dtype=np.float64)
+                elif sigma is not None:
+                    error = np.full(len(freq), float(sigma))
+                else:
+                    raise Exception("MICROWAVE TRANSMISSION ERROR: Measurement '%s' has no errors on '%s'. Pass sigma to Fit" % (dat.fhandle, val))
+                mask = (freq > 0.) * np.isfinite(value) * np.isfinite(error) * (error > 0.)
+                rows.append(np.full(np.sum(mask), row)); finds.append(np.searchsorted(freqs, freq[mask]))
+                vals.append(value[mask]); invErrs.append(1./error[mask])
+        self.__rows    = np.concatenate(rows)    if len(rows) else np.empty(0, dtype=int)
+        self.__finds   = np.concatenate(finds)   if len(rows) else np.empty(0, dtype=int)
+        self.vals      = np.concatenate(vals)    if len(rows) else np.empty(0)
+        self.__invErrs = np.concatenate(invErrs) if len(rows) else np.empty(0)
+        self.numPoints = len(self.vals)
+        if self.numPoints <= len(self.labels):
+            raise Exception("MICROWAVE TRANSMISSION ERROR: %d measured points cannot constrain %d free parameters" % (self.numPoints, len(self.labels)))
+        self.freqs = freqs*un.GHz_to_Hz
+
+        #Fitted values, their covariance and errors, the chi-square, and the result of every local solve, set by calc()
+        self.values = None
+        self.cov    = None
+        self.errors = None
+        self.chi2   = None
+        self.dof    = self.numPoints - len(self.labels)
+        self.starts = None
+
+    # ***** Public Methods *****
+    #Fit the free parameters, returning the fitted values in SI units
+    def calc(self):
+        x0s = self.candidates()
+        if self.numProcs > 1 and len(x0s) > 1:
+            with cf.ProcessPoolExecutor(min(self.numProcs, len(x0s))) as pool:
+                self.starts = list(pool.map(fitStart, [(self, x0) for x0 in x0s]))
+        else:
+            self.starts = [self.solve(x0) for x0 in x0s]
+        best = min(self.starts, key=lambda start: start["chi2"])
+        self.values = best["x"]
+        self.chi2   = best["chi2"]
+        #Covariance from the Jacobian at the solution, scaled by the chi-square per degree of freedom
+        jac = self.jacobian(self.values)[1]
+        self.cov = np.linalg.pinv(np.dot(jac.T, jac))*(self.chi2/self.dof)
+        self.errors = np.sqrt(np.maximum(np.diag(self.cov), 0.))
+        return self.values
+
+    #Starting points of the local solves: the nominal stack and the lowest chi-square candidates of a population
+    #drawn from the parameter distributions, shape (numStarts, free)
+    def candidates(self):
+        rng = np.random.default_rng(self.seed)
+        pop = np.empty((self.numCandidates, len(self.labels)))
+        pop[0] = self.nominal.T.flatten()[self.__free]
+        for j, i in enumerate(self.__free):
+            pop[1:,j] = self.__param(i).sample(nsample=self.numCandidates - 1, rng=rng)
+        pop = np.clip(pop, self.lower, self.upper)
+        chi2 = np.sum(self.residuals(pop)**2, axis=0)
+        #The nominal stack is always a starting point
+        order = np.concatenate([[0], [ind for ind in np.argsort(chi2, kind='stable') if ind != 0]])
+        return pop[order[:self.numStarts]]
+
+    #Weighted residuals of a (stacks, free) array of parameter values, shape (points, stacks)
+    def residuals(self, X):
+        X = np.atleast_2d(X)
+        ret = np.empty((self.numPoints, len(X)))
+        hou = ho.Hou()
+        batchSize = max(1, self.__batchElems//len(self.freqs))
+        for start in range(0, len(X), batchSize):
+            stop = min(start + batchSize, len(X))
+            stacks = np.repeat(self.nominal.T.flatten()[np.newaxis], stop - start, axis=0)
+            stacks[:, self.__free] = X[start:stop]
+            thicks, indexes, lossTans = stacks[:,0::3], stacks[:,1::3], stacks[:,2::3]
+            outs = np.array(hou.calcBatch(indexes, thicks, lossTans, self.freqs, np.full(stop - start, self.incAngle), self.layers.repeats)[1:])
+            ret[:, start:stop] = (outs[self.__rows, :, self.__finds] - self.vals[:,np.newaxis])*self.__invErrs[:,np.newaxis]
+        return ret
+
+    #Weighted residuals and their forward-difference Jacobian at x, of shapes (points,) and (points, free),
+    #from one batch of the stack at x and the stack with each free parameter stepped in turn
+    def jacobian(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        steps = np.sqrt(np.finfo(np.float64).eps)*np.maximum(abs(x), self.scale)
+        #Step down from parameters at their upper bound
+        steps = np.where(x + steps > self.upper, -steps, steps)
+        X = np.repeat(x[np.newaxis], len(x)+1, axis=0)
+        X[np.arange(1, len(x)+1), np.arange(len(x))] += steps
+        res = self.residuals(X)
+        return res[:,0], (res[:,1:] - res[:,0:1])/steps
+
+    #Local trust-region solve from x0, returning its end point, chi-square, number of evaluations, and status
+    def solve(self, x0):
+        #Imported here, as scipy.optimize is slow to load and only needed for fitting
+        from scipy.optimize import least_squares
+        cache = {}
+        def fun(x):
+            key = x.tobytes()
+            if key not in cache:
+                cache.clear()
+                cache[key] = self.jacobian(x)
+            return cache[key][0]
+        def jac(x):
+            fun(x)
+            return cache[x.tobytes()][1]
+        res = least_squares(fun, x0, jac=jac, bounds=(self.lower, self.upper), x_scale=self.scale, method='trf')
+        return {"x0": np.array(x0), "x": res.x, "chi2": float(np.sum(res.fun**2)), "numEvals": int(res.nfev), "status": int(res.status)}
+
+    #Fitted values and errors keyed by parameter, in SI units
+    def results(self):
+        return cl.OrderedDict([(self.labels[j], (float(self.values[j]), float(self.errors[j]))) for j in range(len(self.labels))])
+
+    #Layers object of the fitted stack, with fitted parameters spread by their errors and the others as passed
+    def fitted(self):
+        rows = []
+        for k, name in enumerate(self.layers.layers):
+            row = [name]
+            for p, param in enumerate(params):
+                par = self.layers.layers[name][param]
+                avg, std = par.getAvg(), par.getStd()
+                if 3*k+p in self.__free:
+                    j = list(self.__free).index(3*k+p)
+                    avg, std = self.values[j], self.errors[j]
+                row.append((avg/par.unit, std/par.unit))
+            rows.append(tuple(row))
+        return ly.Layers(table=rows)
+
+    #Write the fitted stack as a layer file, which can be passed back to the simulation
+    def writeLayers(self, fname):
+        hdr = ['Layer', 'Thickness [mm]', 'Index', 'Loss Tangent [e-4]']
+        layers = self.fitted().layers
+        rows = [[str(name)]+['%.6f +/- %.6f' % (layers[name][param].getAvg()/layers[name][param].unit, layers[name][param].getStd()/layers[name][param].unit)
+                             for param in params] for name in layers]
+        widths = [max([len(row[i]) for row in [hdr]+rows])+2 for i in range(len(hdr))]
+        border = '+'+'+'.join(['-'*width for width in widths])+'+\n'
+        with open(fname, 'w') as f:
+            f.write(border)
+            for row in [hdr]+rows:
+                f.write('|'+'|'.join([(' %-'+str(widths[i]-1)+'s') % (row[i]) for i in range(len(row))])+'|\n')
+                f.write(border)
+        return fname
+
+    # ***** Private Methods *****
+    #Parameter at a position of the flattened (layers, 3) stack
+    def __param(self, i):
+        return list(self.layers.layers.values())[i//3][params[i%3]]
@@ -1,62 +1,278 @@
 #python Version 2.7.2
 import numpy           as np
-import scipy.constants as ct
+from multiprocessing.pool import ThreadPool
+
+#Speed of light [m/s], as in scipy.constants, which is slow to import
+cLight = 299792458.
+
+#Engine version, to be bumped whenever a change alters the calculated spectra
+version = '3'
+
+#Product of two stacks of 2x2 matrices, written out since np.matmul is slow on tiny matrices
+def mul2(A, B):
+    C = np.empty(np.broadcast(A, B).shape, dtype=np.result_type(A, B))
+    C[...,0,0] = A[...,0,0]*B[...,0,0] + A[...,0,1]*B[...,1,0]
+    C[...,0,1] = A[...,0,0]*B[...,0,1] + A[...,0,1]*B[...,1,1]
+    C[...,1,0] = A[...,1,0]*B[...,0,0] + A[...,1,1]*B[...,1,0]
+    C[...,1,1] = A[...,1,0]*B[...,0,1] + A[...,1,1]*B[...,1,1]
+    return C
+
+#Ordered product of a stack of 2x2 matrices along the leading axis, reduced pairwise in log2(len(E)) batched steps
+def treeProd(E):
+    while len(E) > 1:
+        prod = mul2(E[0:len(E)-1:2], E[1:len(E):2])
+        #An unpaired last matrix is folded into the last product
+        if len(E) % 2:
+            prod[-1] = mul2(prod[-1], E[-1])
+        E = prod
+    return E[0]
+
+#Integer power m of a stack of 2x2 matrices in closed form. With C' = C/sqrt(det(C)) unimodular and
+#tr(C')/2 = cosh(L), the Chebyshev identity gives C'^m = U_{m-1} C' - U_{m-2} I with U_{k-1} = sinh(kL)/sinh(L),
+#so the cost does not depend on m. The ratio is even in L, which keeps it accurate near band edges where L -> 0
+def matPow(C, m):
+    P = np.zeros(C.shape, dtype=np.complex128)
+    if m == 0:
+        P[...,0,0] = 1.
+        P[...,1,1] = 1.
+        return P
+    s = np.sqrt((C[...,0,0]*C[...,1,1] - C[...,0,1]*C[...,1,0]).astype(np.complex128))
+    L = np.arccosh(0.5*(C[...,0,0] + C[...,1,1])/s)
+    sh = np.sinh(L)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        U1 = np.where(sh == 0., m*np.cosh(m*L)/np.cosh(L), np.sinh(m*L)/sh)
+        U2 = np.where(sh == 0., (m-1)*np.cosh((m-1)*L)/np.cosh(L), np.sinh((m-1)*L)/sh)
+    P[...] = (U1*s**(m-1))[...,np.newaxis,np.newaxis]*C
+    P[...,0,0] -= U2*s**m
+    P[...,1,1] -= U2*s**m
+    return P
+
+#Reflection coefficients between layers with indexes n0 and n1 and angle cosines c0 and c1, with the
+#polarization on the leading axis as (s, p)
+def refl(n0, c0, n1, c1):
+    rs = (n0*c0 - n1*c1)/(n0*c0 + n1*c1)
+    rp = (n0/c0 - n1/c1)/(n0/c0 + n1/c1)
+    return np.stack([rs, rp])
+
+#Exponential propagation factors through layers with index n, thickness d, angle cosine c, and loss tangent lt,
+#each of shape n.shape + freqArr.shape
+def propagation(n, d, c, lt, freqArr):
+    phase = (2.*np.pi*n*d/c)[...,np.newaxis]*freqArr/cLight
+    pp = np.exp(phase*( 0.5*lt[...,np.newaxis] + 1.0j))
+    pm = np.exp(phase*(-0.5*lt[...,np.newaxis] - 1.0j))
+    return pp, pm
+
+#Element matrices for propagation through a layer followed by an interface, from the interface reflection and
+#transmission coefficients and the propagation factors, which broadcast against each other once a trailing
+#frequency axis is added to the coefficients. Shape broadcast(r[..., np.newaxis], pp) + (2, 2)
+def element(r, t, pp, pm):
+    a = 1./t[...,np.newaxis]
+    b = r[...,np.newaxis]*a
+    E = np.empty(np.broadcast(a, pp).shape+(2, 2), dtype=np.complex128)
+    E[...,0,0] = pp*a
+    E[...,0,1] = pp*b
+    E[...,1,0] = pm*b
+    E[...,1,1] = pm*a
+    return E
+
+#Element matrices for propagation through layers with index n0, thickness d0, loss tangent lt0, and angle
+#cosine c0, each followed by the interface into a layer with index n1 and angle cosine c1. Takes 1D arrays
+#over the elements and returns shape (elements, pol, freqs, 2, 2), with the polarization ordered (s, p)
+def elements(n0, c0, d0, lt0, n1, c1, freqArr):
+    n0, c0, d0, lt0, n1, c1 = [np.asarray(arr, dtype=np.float64) for arr in (n0, c0, d0, lt0, n1, c1)]
+    r = np.moveaxis(refl(n0, c0, n1, c1), 0, 1)
+    pp, pm = propagation(n0, d0, c0, lt0, np.asarray(freqArr, dtype=np.float64))
+    return element(r, 1. + r, pp[:,np.newaxis], pm[:,np.newaxis])
+
+#Transmitted, reflected, and absorbed power from stack matrices with the polarization on the leading axis as (s, p)
+def spectra(M):
+    #Calculate transmitted power
+    Tran_s, Tran_p = np.abs(1./M[...,0,0])**2
+
+    #Calculate reflected power
+    Refl_s, Refl_p = np.abs(M[...,1,0]/M[...,0,0])**2
+
+    #Calculate absorbed power
+    Abso_s = 1. - Tran_s - Refl_s
+    Abso_p = 1. - Tran_p - Refl_p
+
+    return Tran_p, Tran_s, Refl_p, Refl_s, Abso_p, Abso_s
 
 #Class for calculating boundary conditions
 class Hou:
-    def __init__(self):
+    def __init__(self, deepLayers=64, deepPoints=64, numThreads=1):
         self.__normInc = 0.
+        #Stacks with at least deepLayers layers are reduced with a pairwise tree rather than layer by layer when
+        #there are at most deepPoints (trial, frequency) points per thread. Larger batches already amortize the
+        #per-layer overhead and stay faster layer by layer
+        self.deepLayers = deepLayers
+        self.deepPoints = deepPoints
+        #Number of threads over which the tree reduction splits the frequencies
+        self.numThreads = numThreads
+        #Maximum number of element matrices held at once by the tree reduction
+        self.__deepElems = 2**21
         return
 
     #Transmission through dielectric stack
-    def calc(self, nArr, dArr, ltArr, freqArr, incAng=None):
-        if incAng == None:
-            incAng = self.__normInc
-            
+    def calc(self, nArr, dArr, ltArr, freqArr, incAng=None, repeats=None, symmetric=None):
         #Number of interfaces to be analyzed
-        if (len(nArr) == len(dArr)) and (len(nArr) == len(ltArr)):
-            #Number of interfaces
-            numInt = len(nArr) - 1
-        else:
+        if not ((len(nArr) == len(dArr)) and (len(nArr) == len(ltArr))):
             raise Exception('Error in Hou.trans(): len(nArr), len(dArr), and len(ltArr) must be equal')
 
+        #Evaluate the stack as a batch of one trial
+        outs = self.calcBatch([nArr], [dArr], [ltArr], freqArr, incAng, repeats, symmetric)[1:]
+
+        #Frequencies
+        Freq = freqArr
+
+        Tran_p, Tran_s, Refl_p, Refl_s, Abso_p, Abso_s = [out[0] for out in outs]
+        return Freq, Tran_p, Tran_s, Refl_p, Refl_s, Abso_p, Abso_s
+
+    #Transmission through a batch of dielectric stacks, with (trials, layers) input arrays and (trials, freqs) outputs.
+    #repeats lists (start, stop, count) blocks, meaning that layers [start, stop) form a cell repeated count times.
+    #symmetric declares that every stack is mirror-symmetric about its center layer, so that only the first half
+    #is evaluated. If None, this is detected from the layer values
+    def calcBatch(self, nArr, dArr, ltArr, freqArr, incAng=None, repeats=None, symmetric=None):
+        if incAng is None:
+            incAng = self.__normInc
+
+        #Stack the layer parameters into contiguous (trials, layers) arrays
+        nArr  = np.atleast_2d(np.asarray(nArr,  dtype=np.float64))
+        dArr  = np.atleast_2d(np.asarray(dArr,  dtype=np.float64))
+        ltArr = np.atleast_2d(np.asarray(ltArr, dtype=np.float64))
+        if not (nArr.shape == dArr.shape == ltArr.shape):
+            raise Exception('Error in Hou.calcBatch(): nArr, dArr, and ltArr must have the same (trials, layers) shape')
+        numTrials, numLayers = nArr.shape
+        #Number of interfaces
+        numInt = numLayers - 1
+        if numInt < 1:
+            raise Exception('Error in Hou.calcBatch(): at least two layers are needed to define an interface')
+        freqArr = np.asarray(freqArr, dtype=np.float64)
+        incAng  = np.broadcast_to(np.asarray(incAng, dtype=np.float64), (numTrials,))
+
         #Calculate the angles of propogation in each layer
-        theta = [incAng]
+        theta = np.empty((numTrials, numLayers))
+        theta[:,0] = incAng
         for i in range(numInt):
-            newAng = np.arcsin((nArr[i]/nArr[i+1])*np.sin(theta[i]))
-            theta.append(newAng)
-        theta = np.array(theta)
-        #Calculate the reflection coefficients
-        rs = np.array([(nArr[i]*np.cos(theta[i]) - nArr[i+1]*np.cos(theta[i+1]))/(nArr[i]*np.cos(theta[i]) + nArr[i+1]*np.cos(theta[i+1])) for i in range(numInt)])
-        rp = np.array([(nArr[i]*(1./np.cos(theta[i])) - nArr[i+1]*(1./np.cos(theta[i+1])))/(nArr[i]*(1./np.cos(theta[i])) + nArr[i+1]*(1./np.cos(theta[i+1]))) for i in range(numInt)])
+            theta[:,i+1] = np.arcsin((nArr[:,i]/nArr[:,i+1])*np.sin(theta[:,i]))
+        cos = np.cos(theta)
+
+        #Calculate the reflection coefficients, with the polarization on the leading axis as (s, p)
+        r = refl(nArr[:,:-1], cos[:,:-1], nArr[:,1:], cos[:,1:])
         #Calculate transmission coefficients
-        ts = np.array([1.+rs[i] for i in range(0, numInt)])
-        tp = np.array([1.+rp[i] for i in range(0, numInt)])
-        
-        #Calculate reflection and transmission for each frequency
-        Ms = np.matrix([[1., rs[0]],[rs[0], 1.]])*(1./ts[0]) #Just the identity matrix for the s polarization
-        Mp = np.matrix([[1., rp[0]],[rp[0], 1.]])*(1./tp[0]) #Just the identity matrix for the p polarization
-        for i in range(1, numInt):
-            #Calculate the exponential propogation factors
-            pp = (2.*ct.pi*nArr[i]*dArr[i]*(1./np.cos(theta[i]))*np.array(freqArr)/ct.c)*( 0.5*ltArr[i] + 1.0j)
-            pm = (2.*ct.pi*nArr[i]*dArr[i]*(1./np.cos(theta[i]))*np.array(freqArr)/ct.c)*(-0.5*ltArr[i] - 1.0j)
-            #Calculate new propogation matrices
-            Ms = Ms*np.matrix([[np.exp(pp), 0],[0, np.exp(pm)]])*np.matrix([[1., rs[i]],[rs[i], 1.]])*(1./ts[i])
-            Mp = Mp*np.matrix([[np.exp(pp), 0],[0, np.exp(pm)]])*np.matrix([[1., rp[i]],[rp[i], 1.]])*(1./tp[i])
-            
+        t = 1. + r
+
+        #Mirror-symmetric stacks follow from the half stack H up to the center layer c as H P_c X H^-1 X,
+        #with X = [[0,1],[1,0]], since the mirrored interfaces invert theirs and X P X = P^-1
+        if symmetric is None:
+            symmetric = (np.array_equal(nArr, nArr[:,::-1]) and np.array_equal(dArr, dArr[:,::-1])
+                         and np.array_equal(ltArr, ltArr[:,::-1]))
+        symmetric = symmetric and numLayers % 2 == 1 and not repeats
+        c = numLayers//2
+        #Only the layers up to the center propagate in the half stack
+        numProp = c+1 if symmetric else numLayers
+
+        #Calculate the exponential propogation factors, shape (trials, layers, freqs)
+        pp, pm = propagation(nArr[:,:numProp], dArr[:,:numProp], cos[:,:numProp], ltArr[:,:numProp], freqArr)
+        #There is no propagation through the incident medium
+        pp[:,0] = 1.
+        pm[:,0] = 1.
+
+        #Closed-form matrices for all but the last pass through each repeated cell, keyed by the cell's first layer
+        pows = self.__repeatPows(nArr, cos, r, t, pp, pm, repeats)
+
+        #Calculate the stack matrices, shape (pol, trials, freqs, 2, 2)
+        if symmetric:
+            H = self.__product(r, t, pp, pm, pows, c)
+            M = mul2(H, self.__mirror(H, pp[:,c], pm[:,c]))
+        else:
+            M = self.__product(r, t, pp, pm, pows, numInt)
+
         #Frequencies
         Freq = freqArr
-        
-        #Calculate transmitted power
-        Tran_s = np.array(list(map(lambda x: abs(x)**2, 1./(Ms.item(0,0)))))
-        Tran_p = np.array(list(map(lambda x: abs(x)**2, 1./(Mp.item(0,0)))))
-
-        #Calculate reflected power
-        Refl_s = np.array(list(map(lambda x: abs(x)**2, Ms.item(1,0)/Ms.item(0,0))))
-        Refl_p = np.array(list(map(lambda x: abs(x)**2, Mp.item(1,0)/Mp.item(0,0))))
-
-        #Calculate absorbed power
-        Abso_s = 1. - Tran_s - Refl_s
-        Abso_p = 1. - Tran_p - Refl_p
-        
+
+        Tran_p, Tran_s, Refl_p, Refl_s, Abso_p, Abso_s = spectra(M)
         return Freq, Tran_p, Tran_s, Refl_p, Refl_s, Abso_p, Abso_s
+
+    #Ordered product of the first numEl element matrices, along with any repeated cells
+    def __product(self, r, t, pp, pm, pows, numEl):
+        if numEl >= self.deepLayers and pp.shape[0]*pp.shape[2] <= self.deepPoints*self.numThreads:
+            return self.__treeCalc(r[:,:,:numEl], t[:,:,:numEl], pp, pm, pows)
+        M = element(r[:,:,0], t[:,:,0], pp[:,0], pm[:,0])
+        for i in range(1, numEl):
+            if i in pows:
+                M = mul2(M, pows[i])
+            M = mul2(M, element(r[:,:,i], t[:,:,i], pp[:,i], pm[:,i]))
+        return M
+
+    #P_c X H^-1 X for the half-stack matrices H and the center layer's propagation factors
+    def __mirror(self, H, pp, pm):
+        det = H[...,0,0]*H[...,1,1] - H[...,0,1]*H[...,1,0]
+        G = np.empty_like(H)
+        G[...,0,0] =  pp*H[...,0,0]/det
+        G[...,0,1] = -pp*H[...,1,0]/det
+        G[...,1,0] = -pm*H[...,0,1]/det
+        G[...,1,1] =  pm*H[...,1,1]/det
+        return G
+
+    #For each repeated block of layers [start, stop) with count N, the cell matrix raised to the power N - 1.
+    #The cell runs from its first layer back round to the interface into its first layer again, so the block
+    #is this power followed by the cell's own elements ending at the interface behind the block
+    def __repeatPows(self, nArr, cos, r, t, pp, pm, repeats):
+        pows = {}
+        if not repeats:
+            return pows
+        last = 0
+        for start, stop, count in sorted(repeats):
+            if start <= last or stop <= start or stop > nArr.shape[1]-1 or count < 1:
+                raise Exception('Error in Hou.calcBatch(): repeated blocks must be non-overlapping ranges of inner layers with count >= 1')
+            last = stop - 1
+            if count == 1:
+                continue
+            C = element(r[:,:,start], t[:,:,start], pp[:,start], pm[:,start])
+            for i in range(start+1, stop-1):
+                C = mul2(C, element(r[:,:,i], t[:,:,i], pp[:,i], pm[:,i]))
+            #Interface from the cell's last layer back into its first
+            rc = refl(nArr[:,stop-1], cos[:,stop-1], nArr[:,start], cos[:,start])
+            Ec = element(rc, 1. + rc, pp[:,stop-1], pm[:,stop-1])
+            if stop - start > 1:
+                C = mul2(C, Ec)
+            else:
+                C = Ec
+            pows[start] = matPow(C, count-1)
+        return pows
+
+    #Stack matrices from a pairwise tree reduction of the elements, in frequency chunks that bound the
+    #memory held by the elements and that are optionally spread across threads
+    def __treeCalc(self, r, t, pp, pm, pows):
+        numTrials, numFreqs = pp.shape[0], pp.shape[2]
+        numInt = r.shape[-1]
+        chunkSize = max(1, self.__deepElems//(2*numTrials*numInt))
+        numChunks = min(numFreqs, max(self.numThreads, -(-numFreqs//chunkSize)))
+        bounds = np.linspace(0, numFreqs, numChunks+1).astype(int)
+        M = np.empty((2, numTrials, numFreqs, 2, 2), dtype=np.complex128)
+        #Element axis leading, shape (interfaces, pol, trials)
+        rE = np.moveaxis(r, -1, 0)
+        tE = np.moveaxis(t, -1, 0)
+        def reduceChunk(j):
+            fs = slice(bounds[j], bounds[j+1])
+            #Shape (interfaces, 1, trials, chunk)
+            ppE = np.moveaxis(pp[:,:numInt,fs], 1, 0)[:,np.newaxis]
+            pmE = np.moveaxis(pm[:,:numInt,fs], 1, 0)[:,np.newaxis]
+            E = element(rE, tE, ppE, pmE)
+            #Repeated cells enter just ahead of their first element
+            if pows:
+                starts = sorted(pows)
+                E = np.insert(E, starts, np.stack([pows[k][:,:,fs] for k in starts]), axis=0)
+            M[:,:,fs] = treeProd(E)
+        if self.numThreads > 1 and numChunks > 1:
+            pool = ThreadPool(min(self.numThreads, numChunks))
+            try:
+                pool.map(reduceChunk, range(numChunks))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for j in range(numChunks):
+                reduceChunk(j)
+        return M
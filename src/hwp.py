@@ -7,6 +7,10 @@ import pickle as pkl
 import scipy.integrate as itg
 import copy
 
+#Custom classes
+from src.sapphire import Sapphire
+from src.physics  import Physics
+
 #Class for the HWP
 class HWP:
     def __init__(self):
@@ -46,15 +50,33 @@ class HWP:
     
     #Mueller matrix formalism using code from Tomo's thesis
     #***** Private functions *****
-    #Rotation matrix
+    #Rotation matrices, shape theta.shape + (4, 4)
     def __R(self, theta):
         theta = self.__ph.degToRad(theta)
-        return np.matrix([[1,0,0,0],[0,np.cos(2*theta),-np.sin(2*theta),0],[0,np.sin(2*theta),np.cos(2*theta),0],[0,0,0,1]])
+        R = np.zeros(np.shape(theta)+(4,4))
+        R[...,0,0] = 1.
+        R[...,1,1] = np.cos(2*theta)
+        R[...,1,2] = -np.sin(2*theta)
+        R[...,2,1] = np.sin(2*theta)
+        R[...,2,2] = np.cos(2*theta)
+        R[...,3,3] = 1.
+        return R
 
-    #Retardance matrix
+    #Retardance matrices, shape delta.shape + (4, 4)
     def __Gamma(self, delta):
         delta = self.__ph.degToRad(delta)
-        return np.matrix([[1,0,0,0],[0,1,0,0],[0,0,np.cos(delta),-np.sin(delta)],[0,0,np.sin(delta),np.cos(delta)]])
+        G = np.zeros(np.shape(delta)+(4,4))
+        G[...,0,0] = 1.
+        G[...,1,1] = 1.
+        G[...,2,2] = np.cos(delta)
+        G[...,2,3] = -np.sin(delta)
+        G[...,3,2] = np.sin(delta)
+        G[...,3,3] = np.cos(delta)
+        return G
+
+    #Intensity through the x polarizer
+    def __intensity(self, S):
+        return np.einsum('ij,...j->...i', self.__GX.A, S)[...,0]
 
     #***** Public Functions *****
     #Half-wave plate thickness [m]
@@ -68,65 +90,71 @@ class HWP:
 
         return np.pi/((2*np.pi)*(eN - oN)/self.__ph.lamb(freq))
     
-    #Analytic function for calculating modulation phase
+    #Analytic function for calculating modulation phase [deg] from the polarization angle alpha [deg] and HWP angle rho [deg]
     def phaseAnalytic(self, intensity, modEff, alpha, rho):
         return -0.25*self.__ph.radToDeg(np.arccos((2.*intensity - 1.)/(modEff))) + rho - 0.5*alpha
     
-    #HWP transformation matrix for a perfect HWP (no internal reflections)
+    #HWP transformation matrix for a perfect HWP (no internal reflections), shape broadcast(nu, rho) + (4, 4)
     def T(self, nu, rho, angles=None, d=None, oN=None, eN=None):
-        if angles == None:
+        if angles is None:
             angles = self.plateAngles_3
-        if d == None:
+        if d is None:
             d = self.thickIdeal
-        if oN == None:
+        if oN is None:
             oN = self.__sp.oN
-        if eN == None:
-            eN = self.__sp.eN        
+        if eN is None:
+            eN = self.__sp.eN
+        d = np.broadcast_to(d, np.shape(angles))
 
-        Tret = np.matrix([[1,0,0,0], [0,1,0,0],[0,0,1,0],[0,0,0,1]])
+        nu, rho = np.broadcast_arrays(np.asarray(nu, dtype=np.float64), np.asarray(rho, dtype=np.float64))
+        Tret = np.tile(np.identity(4), nu.shape+(1,1))
         for i in range(len(angles)):
-            Tret = self.__R(-angles[i]-rho)*self.__Gamma(self.__ph.birefringentRot(nu, d[i], oN, eN))*self.__R(angles[i]+rho)*Tret
+            Tret = np.einsum('...ij,...jk,...kl,...lm->...im', self.__R(-angles[i]-rho), self.__Gamma(self.__ph.birefringentRot(nu, d[i], oN, eN)), self.__R(angles[i]+rho), Tret)
         return Tret
 
-    #Output Stokes vector for a perfect HWP (no internal reflections)
+    #Output Stokes vector for a perfect HWP (no internal reflections), for an input polarization angle alpha [deg]
+    #and HWP angle rho [deg], shape broadcast(alpha, nu, rho) + (4,)
     def Sout(self, alpha, nu, rho, angles=None, d=None, P=None):
-        if angles == None:
+        if angles is None:
             angles = self.plateAngles_3
-        if d == None:
+        if d is None:
             d = self.thickIdeal
-        if P == None:
+        if P is None:
             P = self.defPfrac
 
-        return self.T(nu, rho, angles, d)*self.__ph.Stokes(P,alpha)
+        alpha, nu, rho = np.broadcast_arrays(alpha, nu, rho)
+        return np.einsum('...ij,...j->...i', self.T(nu, rho, angles, d), self.__ph.Stokes(P, alpha))
 
-    #Modulation efficiency for a perfect HWP (no internal reflections)
+    #Modulation efficiency for a perfect HWP (no internal reflections), for an input polarization angle alpha [deg], shape broadcast(alpha, nu)
     def modEff(self, alpha, nu, angles=None, d=None, P=None):
-        if angles == None:
+        if angles is None:
             angles = self.plateAngles_3
-        if d == None:
+        if d is None:
             d = self.thickIdeal
-        if P == None:
+        if P is None:
             P = self.defPfrac
 
+        #Evaluate the full rotation of the HWP on a trailing axis
         rho = np.linspace(0., 90., 180)
-        Intensities = []
-        for i in rho:
-            Intensities.append((self.__GX*self.Sout(alpha, nu, i, angles, d, P)).item(0))
-        Intensities = np.array(Intensities)
-        modEff = (np.amax(Intensities) - np.amin(Intensities))/(np.amax(Intensities) + np.amin(Intensities))
+        alpha, nu = np.broadcast_arrays(alpha, nu)
+        Intensities = self.__intensity(self.Sout(alpha[...,np.newaxis], nu[...,np.newaxis], rho, angles, d, P))
+        modEff = (np.amax(Intensities, axis=-1) - np.amin(Intensities, axis=-1))/(np.amax(Intensities, axis=-1) + np.amin(Intensities, axis=-1))
         return modEff
 
-    #Modulation phase for a perfect HWP (no internal reflections) [deg]
+    #Modulation phase for a perfect HWP (no internal reflections) w.r.t. the ideal frequency [deg], for an input polarization
+    #angle alpha [deg] and HWP angle rho [deg], shape broadcast(alpha, nu, rho)
     def phase(self, alpha, nu, rho, angles=None, d=None, P=None):
-        if plateAngles == None:
-            plateAngles = self.plateAngles_3
-        if d == None:
+        if angles is None:
+            angles = self.plateAngles_3
+        if d is None:
             d = self.thickIdeal
-        if P == None:
+        if P is None:
             P = self.defPfrac
-        
-        intensityRef = (self.__GX*self.Sout(alpha, freq, rho, angles, d, P)).item(0)
-        intensity    = (self.__GX*self.Sout(alpha, nu,   rho, angles, d, P)).item(0)
-        phaseRef = -0.25*self.__ph.radToDeg(np.arccos((2.*intensityRef - 1.)/(MEperfect(alpha, freq, angles, d, P)))) + rho - 0.5*alpha
-        phase    = -0.25*self.__ph.radToDeg(np.arccos((2.*intensity    - 1.)/(MEperfect(alpha, nu,   angles, d, P)))) + rho - 0.5*alpha 
+
+        alpha, nu, rho = np.broadcast_arrays(alpha, nu, rho)
+        freq = np.full(nu.shape, self.freqIdeal)
+        intensityRef = self.__intensity(self.Sout(alpha, freq, rho, angles, d, P))
+        intensity    = self.__intensity(self.Sout(alpha, nu,   rho, angles, d, P))
+        phaseRef = self.phaseAnalytic(intensityRef, self.modEff(alpha, freq, angles, d, P), alpha, rho)
+        phase    = self.phaseAnalytic(intensity,    self.modEff(alpha, nu,   angles, d, P), alpha, rho)
         return phase - phaseRef
@@ -1,32 +1,69 @@
 #Using python 2.7.2
 import numpy       as np
 import collections as cl
+import re
 
 #Custom classes
 import src.parameter  as pm
 import src.unit       as un
+import src.config     as cf
 
+#Class for a stack of dielectric layers, read from a layer file or built from a table. A table is either a
+#sequence of (name, thickness [mm], index, loss tangent [1e-4]) rows or a dictionary of equal-length
+#"Name", "Thickness", "Index", and "LossTan" columns, with names optional in the latter. Values are
+#numbers, (mean, spread) tuples, or strings as written in a layer file
 class Layers:
-    def __init__(self, file):
+    def __init__(self, file=None, table=None):
         #Store input variables
         self.file = file
         
-        #Parse file for layer parameters
-        layers, thicks, indexes, lossTans = np.loadtxt(self.file, comments='+-', skiprows=2, delimiter='|', dtype=np.str, unpack=True)[1:-1]
-        #Build dictionaries of dielectric layers
-        self.layers = cl.OrderedDict({})
-        for i in range(len(layers)):
-            self.layers[layers[i]] = {"Thickness": pm.Parameter("Thickness", thicks[i],   unit=un.mm_to_m, min=0.0, max=np.inf),
-                                      "Index":     pm.Parameter("Index",     indexes[i],                   min=0.0, max=np.inf),
-                                      "LossTan":   pm.Parameter("LossTan",   lossTans[i], unit=1.e-04,     min=0.0, max=np.inf)}
-        
-    #Method to sample layers
-    def sample(self):
-        thicks = []; indexes = []; lossTans = []
-        for k in self.layers:
-            thicks.append(  self.layers[k]["Thickness"].sample())
-            indexes.append( self.layers[k]["Index"    ].sample())
-            lossTans.append(self.layers[k]["LossTan"  ].sample())
+        if table is None and file is None:
+            raise cf.ConfigError("Layers needs either a layer file or a table")
+        try:
+            #Layer files are parsed once per version
+            if table is None:
+                table = cf.parser.layers(self.file)
+            layers, thicks, indexes, lossTans = self.__columns(table)
+            #Build dictionaries of dielectric layers
+            self.layers = cl.OrderedDict({})
+            for i in range(len(layers)):
+                self.layers[layers[i]] = {"Thickness": pm.Parameter("Thickness", thicks[i],   unit=un.mm_to_m, min=0.0, max=np.inf),
+                                          "Index":     pm.Parameter("Index",     indexes[i],                   min=0.0, max=np.inf),
+                                          "LossTan":   pm.Parameter("LossTan",   lossTans[i], unit=1.e-04,     min=0.0, max=np.inf)}
+
+            #Repeated blocks, marked by tagging consecutive layer names as 'Name[Block x N]' to repeat that cell N times.
+            #Stored as (first layer, last layer + 1, N), with sampled values shared by every repetition of the cell
+            self.repeats = self.__repeats([str(layer).strip() for layer in layers])
+        #Name the file in errors found past parsing
+        except cf.ConfigError as e:
+            if e.fname is None and self.file is not None:
+                raise cf.ConfigError(e.message, self.file)
+            raise
+
+    #Method to sample layers, either one trial as lists or nsample trials as (nsample, layers) arrays
+    def sample(self, nsample=None, rng=None):
+        if nsample is None:
+            thicks = []; indexes = []; lossTans = []
+            for k in self.layers:
+                thicks.append(  self.layers[k]["Thickness"].sample(rng=rng))
+                indexes.append( self.layers[k]["Index"    ].sample(rng=rng))
+                lossTans.append(self.layers[k]["LossTan"  ].sample(rng=rng))
+            return thicks, indexes, lossTans
+        thicks = np.empty((nsample, len(self.layers))); indexes = np.empty((nsample, len(self.layers))); lossTans = np.empty((nsample, len(self.layers)))
+        for i, k in enumerate(self.layers):
+            thicks[:,i]   = self.layers[k]["Thickness"].sample(nsample=nsample, rng=rng)
+            indexes[:,i]  = self.layers[k]["Index"    ].sample(nsample=nsample, rng=rng)
+            lossTans[:,i] = self.layers[k]["LossTan"  ].sample(nsample=nsample, rng=rng)
+        return thicks, indexes, lossTans
+
+    #Method to map (nsample, 3*layers) uniform variates onto (nsample, layers) arrays,
+    #with columns ordered as thickness, index, loss tangent for each layer
+    def transform(self, u):
+        thicks = np.empty((len(u), len(self.layers))); indexes = np.empty((len(u), len(self.layers))); lossTans = np.empty((len(u), len(self.layers)))
+        for i, k in enumerate(self.layers):
+            thicks[:,i]   = self.layers[k]["Thickness"].transform(u[:,3*i  ])
+            indexes[:,i]  = self.layers[k]["Index"    ].transform(u[:,3*i+1])
+            lossTans[:,i] = self.layers[k]["LossTan"  ].transform(u[:,3*i+2])
         return thicks, indexes, lossTans
 
     #Method to get average values for layers
@@ -37,4 +74,43 @@ class Layers:
             indexes.append( self.layers[k]["Index"    ].getAvg())
             lossTans.append(self.layers[k]["LossTan"  ].getAvg())
         return thicks, indexes, lossTans
-    
+
+    #***** Private Methods *****
+    #Name, thickness, index, and loss tangent columns of a table
+    def __columns(self, table):
+        if isinstance(table, dict):
+            cols = [list(table[key]) for key in ["Thickness", "Index", "LossTan"]]
+            if "Name" in table:
+                names = [str(name) for name in table["Name"]]
+            else:
+                names = ['Layer%d' % (i) for i in range(len(cols[0]))]
+        else:
+            rows = [tuple(row) for row in table]
+            if any([len(row) != 4 for row in rows]):
+                raise cf.ConfigError("layer table rows must be (name, thickness, index, loss tangent)")
+            names = [str(row[0]) for row in rows]
+            cols = [[row[i] for row in rows] for i in range(1, 4)]
+        if len(set([len(names)]+[len(col) for col in cols])) != 1:
+            raise cf.ConfigError("layer table columns must have equal lengths")
+        if len(set(names)) != len(names):
+            raise cf.ConfigError("layer names must be unique")
+        return [names]+cols
+
+    def __repeats(self, names):
+        tags = cl.OrderedDict({})
+        for i in range(len(names)):
+            match = re.match(r'^.*\[\s*(\w+)\s*[xX]\s*(\d+)\s*\]$', names[i])
+            if match is None:
+                continue
+            tag, count = match.group(1), int(match.group(2))
+            if tag not in tags:
+                tags[tag] = [i, i+1, count]
+            elif tags[tag][1] != i or tags[tag][2] != count:
+                raise cf.ConfigError("layers in repeated block '%s' must be consecutive and share the same repeat count" % (tag))
+            else:
+                tags[tag][1] = i+1
+        repeats = [tuple(tags[tag]) for tag in tags]
+        for start, stop, count in repeats:
+            if start == 0 or stop == len(names) or count < 1:
+                raise cf.ConfigError("repeated blocks cannot include the first or last layer and must repeat at least once")
+        return repeats
@@ -1,16 +1,82 @@
-import numpy as np
-import          os
+import numpy       as np
+import collections as cl
+import json        as js
+import warnings    as wn
+import                os
 
-#Class for importing measured data from various measurement setups
+#Names of the measured outputs, in the order of Measurement.outputs
+outputNames = ['freq',
+               'ptrans', 'ptranserr', 'strans', 'stranserr',
+               'prefl',  'preflerr',  'srefl',  'sreflerr',
+               'pabso',  'pabsoerr',  'sabso',  'sabsoerr']
+
+#Registered measurement apparatuses, keyed by the descriptor that marks a data file name as coming from
+#the apparatus, each as (data file columns to read, function mapping the read columns onto outputs)
+instruments = cl.OrderedDict({})
+
+#Register an apparatus for data files whose names contain descriptor, in any case. convert takes the
+#(columns, points) array of the read columns and returns a dictionary of any of the outputNames
+def register(descriptor, columns, convert):
+    instruments[descriptor.upper()] = (list(columns), convert)
+
+#Registered apparatus whose descriptor appears in a data file name, or None
+def findInstrument(dataFile):
+    name = os.path.basename(dataFile).upper()
+    for descriptor in instruments:
+        if descriptor in name:
+            return descriptor
+    return None
+
+#Reflectometer: frequency and unpolarized reflection, split evenly between the polarizations
+def michRefl(cols):
+    return {"freq":  cols[0],
+            "prefl": cols[1]/2.,
+            "srefl": cols[1]/2.}
+
+#Coherent source: frequency, and transmission with its error, split evenly between the polarizations
+def dickTrans(cols):
+    return {"freq":      cols[0],
+            "ptrans":    cols[1], "ptranserr": cols[2]/np.sqrt(2.),
+            "strans":    cols[1], "stranserr": cols[2]/np.sqrt(2.)}
+
+register('UMich_Reflectometer', [0, 1],    michRefl)
+register('Dick_CoherentSource', [0, 4, 5], dickTrans)
+
+#Read columns of a whitespace-delimited text file with '#' comments in chunks of lines, so that only the
+#selected columns are ever held in memory. Returns a (columns, points) array
+def readColumns(dataFile, columns, chunkLines=2**18):
+    chunks = []
+    with open(dataFile) as f:
+        while True:
+            lines = [line for _, line in zip(range(chunkLines), f)]
+            if not len(lines):
+                break
+            #Chunks holding only comments are empty
+            with wn.catch_warnings():
+                wn.simplefilter('ignore', UserWarning)
+                chunk = np.loadtxt(lines, comments='#', usecols=columns, ndmin=2)
+            if len(chunk):
+                chunks.append(chunk)
+    if not len(chunks):
+        return np.empty((len(columns), 0))
+    return np.ascontiguousarray(np.concatenate(chunks).T)
+
+#Class for importing measured data from various measurement setups. The read columns of each data file are
+#kept in a .npy sidecar next to it, which later loads memory-map as long as the data file is unchanged
 class Measurement:
-    def __init__(self, dataFile=None):
+    def __init__(self, dataFile=None, instrument=None, sidecar=True):
         #Store passed parameters
         self.dataFile = dataFile
         self.fhandle  = self.dataFile.split('.')[0].split('/')[-1]
-        #Allowed measurement apparatuses
-        self.app = {'michRefl': 'UMICH_REFLECTOMETER',
-                    'dick': 'DICK_COHERENTSOURCE'}
-        
+        self.sidecar  = sidecar
+        #Measurement apparatus, identified from the data file name unless passed
+        if instrument is None:
+            self.instrument = findInstrument(self.dataFile)
+        else:
+            self.instrument = instrument.upper()
+        #Whether the last load came from the sidecar
+        self.fromSidecar = False
+
     # ***** Public Methods *****
     def loadData(self, dataFile=None):
         if dataFile is None:
@@ -19,30 +85,43 @@ class Measurement:
             raise Exception("MICROWAVE TRANSMISSION ERROR: No data file to be processes for Measurement class")
         if not os.path.isfile(dataFile):
             raise Exception("MICROWAVE TRANSMISSION ERROR: Unable to locate data file '%s'" % (dataFile))
-        if self.app['michRefl'] in dataFile.upper():
-            freq, refl = np.loadtxt(dataFile, unpack=True, comments='#')
-            self.freq = self.freq
-            self.ptrans  = None;    self.ptranserr = None
-            self.strans  = None;    self.stranserr = None  
-            self.prefl   = refl/2.; self.preflerr = None
-            self.srefl   = refl/2.; self.sreflerr = None
-            self.pabso   = None;    self.pabsoerr = None
-            self.sabso   = None;    self.sabsoerr = None
-        if self.app['dick'] in dataFile.upper():
-            freq, trans, transerr = np.loadtxt(dataFile, unpack=True, comments='#', usecols=[0,4,5])
-            self.freq = freq;
-            self.ptrans  = trans; self.ptranserr = transerr/np.sqrt(2.)
-            self.strans  = trans; self.stranserr = transerr/np.sqrt(2.)
-            self.prefl   = None;  self.preflerr = None
-            self.srefl   = None;  self.sreflerr = None
-            self.pabso   = None;  self.pabsoerr = None
-            self.sabso   = None;  self.sabsoerr = None
-        else:
-            raise Exception("MICROWAVE TRANSMISSION ERROR: Unable to find valid instrument descriptor in data file name '%s'" % (dataFile))
-        self.outputs = (self.freq, 
-                        self.ptrans, self.ptranserr,
-                        self.strans, self.stranserr,
-                        self.prefl,  self.preflerr, 
-                        self.srefl,  self.sreflerr,
-                        self.pabso,  self.pabsoerr,
-                        self.sabso,  self.sabsoerr)
+        inst = self.instrument if dataFile == self.dataFile else findInstrument(dataFile)
+        if inst not in instruments:
+            raise Exception("MICROWAVE TRANSMISSION ERROR: Unable to find valid instrument descriptor in data file name '%s'. Allowed values = %s" % (dataFile, ', '.join(instruments)))
+        columns, convert = instruments[inst]
+        outs = convert(self.__columns(dataFile, columns))
+        for name in outputNames:
+            setattr(self, name, outs.get(name))
+        self.outputs = tuple([getattr(self, name) for name in outputNames])
+        return self.outputs
+
+    # ***** Private Methods *****
+    #Read columns of a data file, from its sidecar when that is up to date
+    def __columns(self, dataFile, columns):
+        self.fromSidecar = False
+        if not self.sidecar:
+            return readColumns(dataFile, columns)
+        fname = dataFile+'.npy'
+        meta = {"size": os.path.getsize(dataFile), "mtime": os.stat(dataFile).st_mtime_ns, "columns": columns}
+        try:
+            with open(dataFile+'.json') as f:
+                if js.load(f) == meta:
+                    cols = np.load(fname, mmap_mode='r')
+                    self.fromSidecar = True
+                    return cols
+        except (IOError, OSError, ValueError):
+            pass
+        cols = readColumns(dataFile, columns)
+        #Write to temporary files and move them into place so that readers never see a partial sidecar.
+        #Data in read-only locations is simply read from text every time
+        try:
+            tmp = '%s.%d.tmp' % (fname, os.getpid())
+            with open(tmp, 'wb') as f:
+                np.save(f, cols)
+            os.replace(tmp, fname)
+            with open(tmp, 'w') as f:
+                js.dump(meta, f)
+            os.replace(tmp, dataFile+'.json')
+        except (IOError, OSError):
+            pass
+        return cols
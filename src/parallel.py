@@ -0,0 +1,64 @@
+#Using python 2.7.2
+import numpy           as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+#Evaluate a block of Monte Carlo trials, writing the T/R/A rows, and the sampled layers if asked for,
+#straight into the shared-memory buffers
+def runTrials(args):
+    sim, shmName, shape, start, stop, offset, seed, sampler, sampName, sampShape = args
+    shm = shared_memory.SharedMemory(name=shmName)
+    samp = shared_memory.SharedMemory(name=sampName) if sampName is not None else None
+    try:
+        outs = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        samples = np.ndarray(sampShape, dtype=np.float64, buffer=samp.buf) if samp is not None else None
+        sim.runTrials(start, stop, outs, seed, sampler, offset, samples)
+        del outs, samples
+    finally:
+        shm.close()
+        if samp is not None:
+            samp.close()
+    return stop - start
+
+#Class for running Monte Carlo trials across a pool of processes. The pool is started on the first run and
+#reused by every later block of trials until close()
+class Parallel:
+    def __init__(self, numProcs):
+        #Store passed parameters
+        self.numProcs = numProcs
+        self.__pool = None
+
+    #Run trials [start, stop) of a Simulate object, one contiguous block and random seed (or Generator) per process.
+    #Returns the (6, trials, freqs) outputs and, if numSamples is nonzero, the (trials, numSamples) sampled layers, or None
+    def run(self, sim, start, stop, numFreqs, seeds, sampler=None, numSamples=0):
+        if len(seeds) != self.numProcs:
+            raise Exception("MICROWAVE TRANSMISSION ERROR: Parallel.run() needs one seed per process")
+        shape = (6, stop - start, numFreqs)
+        sampShape = (stop - start, numSamples)
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape))*np.dtype(np.float64).itemsize)
+        samp = shared_memory.SharedMemory(create=True, size=int(np.prod(sampShape))*np.dtype(np.float64).itemsize) if numSamples else None
+        samples = None
+        try:
+            bounds = np.linspace(start, stop, self.numProcs+1).astype(int)
+            sampName = samp.name if samp is not None else None
+            tasks = [(sim, shm.name, shape, bounds[i], bounds[i+1], start, seeds[i], sampler, sampName, sampShape) for i in range(self.numProcs)]
+            if self.__pool is None:
+                self.__pool = mp.Pool(self.numProcs)
+            self.__pool.map(runTrials, tasks)
+            outs = np.array(np.ndarray(shape, dtype=np.float64, buffer=shm.buf))
+            if samp is not None:
+                samples = np.array(np.ndarray(sampShape, dtype=np.float64, buffer=samp.buf))
+        finally:
+            shm.close()
+            shm.unlink()
+            if samp is not None:
+                samp.close()
+                samp.unlink()
+        return outs, samples
+
+    #Stop the worker processes
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
@@ -1,8 +1,10 @@
-import numpy as np
-import sys   as sy
+import numpy         as np
+
+#Custom classes
+import src.config    as cf
 
 class Parameter:
-    def __init__(self, name, input, unit=1.0, min=None, max=None, type=np.float):
+    def __init__(self, name, input, unit=1.0, min=None, max=None, type=float):
         #The string that delimits the mean value from the spread
         self.__spreadDelim = '+/-'
         
@@ -18,8 +20,14 @@ class Parameter:
         self.oAxis = 1
         self.eAxis = 2
 
-        #Identify parameter spread
-        if self.__spreadDelim in input:
+        #Identify parameter spread, passed either in the string or as a (mean, spread) tuple.
+        #Other values are numbers, sequences or arrays, or strings as read from the input files
+        if isinstance(input, tuple):
+            if len(input) != 2:
+                raise cf.ConfigError("Passed value %s for parameter %s must be a (mean, spread) pair" % (str(input), self.name))
+            self.avg = self.__float(input[0], self.unit)
+            self.std = self.__float(input[1], self.unit)
+        elif isinstance(input, str) and self.__spreadDelim in input:
             vals     = input.split(self.__spreadDelim)
             self.avg = self.__float(vals[0], self.unit)
             self.std = self.__float(vals[1], self.unit)
@@ -27,12 +35,14 @@ class Parameter:
             self.avg = self.__float(input,   self.unit)
             self.std = self.__zero(self.avg)
             
-        #Check that the value is within the allowed range. If not, terminate the program
-        if not isinstance(self.avg, str):
-            if np.any(self.avg < self.min):
-                sy.exit("Passed value %f for parameter %s lower than the mininum allowed value %f" % (self.avg, self.name, self.min))
-            elif np.any(self.avg > self.max):
-                sy.exit("Passed value %f for parameter %s greater than the maximum allowed value %f" % (self.avg, self.name, self.max))
+        #Check that the value is a number, an array, or 'NA', and that it is within the allowed range
+        if isinstance(self.avg, str):
+            if not self.isEmpty():
+                raise cf.ConfigError("Passed value '%s' for parameter %s is not a number" % (str(input), self.name))
+        elif np.any(self.avg < self.min):
+            raise cf.ConfigError("Passed value %s for parameter %s lower than the mininum allowed value %s" % (str(input), self.name, str(self.min)))
+        elif np.any(self.avg > self.max):
+            raise cf.ConfigError("Passed value %s for parameter %s greater than the maximum allowed value %s" % (str(input), self.name, str(self.max)))
 
     #***** Public Methods *****
     def isEmpty(self):
@@ -70,34 +80,45 @@ class Parameter:
     def getStd(self, axis=1):
         return self.fetch(axis)[1]
 
-    def sample(self, axis=1, nsample=1, min=None, max=None):
+    def sample(self, axis=1, nsample=1, min=None, max=None, rng=None):
         if self.isEmpty(): 
             return 'NA'
         else:
             avg, std = self.fetch(axis)
-            if np.any(std <= 0.): return avg
-            else:         
-                if nsample == 1: samp = np.random.normal(avg, std, nsample)[0]
-                else:            samp = np.random.normal(avg, std, nsample)
-                
-            if min is not None: 
-                if samp < min: return min
-            else:
-                if samp < self.min: return self.min
-            if max is not None:
-                if samp > max: return max
+            if np.any(std <= 0.):
+                if nsample == 1: return avg
+                else:            return np.full(nsample, avg)
             else:
-                if samp > self.max: return self.max
-            return samp
+                if rng is None: rng = np.random
+                if nsample == 1: samp = rng.normal(avg, std, nsample)[0]
+                else:            samp = rng.normal(avg, std, nsample)
+
+            return self.__clip(samp, min, max)
+
+    #Map uniform variates u in (0, 1) onto the parameter distribution through the inverse normal CDF
+    def transform(self, u, axis=1, min=None, max=None):
+        if self.isEmpty():
+            return 'NA'
+        else:
+            avg, std = self.fetch(axis)
+            #Imported here, as scipy.special is slow to load and only needed for quasi-Monte Carlo runs
+            import scipy.special as sc
+            if np.any(std <= 0.): return np.full(np.shape(u), avg)
+            else:                 samp = avg + std*sc.ndtri(np.clip(u, np.finfo(np.float64).tiny, 1. - np.finfo(np.float64).eps))
+            return self.__clip(samp, min, max)
 
     #***** Private Methods *****
     def __float(self, val, unit=1.0):
+        if isinstance(val, str):
+            val = cf.value(val)
+            if isinstance(val, (str, tuple)):
+                return str(val)
         try:
             return unit*float(val)
-        except:
+        except (TypeError, ValueError):
             try:
-                return unit*np.array(eval(val)).astype(np.float)
-            except:
+                return unit*np.array(val).astype(np.float64)
+            except (TypeError, ValueError):
                 return str(val)
 
     def __zero(self, val):
@@ -105,3 +126,10 @@ class Parameter:
             return np.zeros(len(val))
         except:
             return 0.
+
+    def __clip(self, samp, min=None, max=None):
+        if min is None: min = self.min
+        if max is None: max = self.max
+        if not isinstance(min, str): samp = np.maximum(samp, min)
+        if not isinstance(max, str): samp = np.minimum(samp, max)
+        return samp
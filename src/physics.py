@@ -73,10 +73,10 @@ class Physics:
     def birefringentRot(self, freq, thick, oN, eN):
         return 360.*(eN - oN)*thick/self.lamb(freq)
 
-    #Stokes vector
+    #Stokes vectors for a polarization fraction and polarization angle [deg], shape broadcast(polFrac, polAngle) + (4,)
     def Stokes(self, polFrac, polAngle):
-        polAngle = self.degToRad(polAngle)
-        return np.matrix([[1.],[polFrac*np.cos(2.*polAngle)],[polFrac*np.sin(2.*polAngle)],[0]])
+        polFrac, polAngle = np.broadcast_arrays(np.asarray(polFrac, dtype=np.float64), self.degToRad(polAngle))
+        return np.stack([np.ones(polFrac.shape), polFrac*np.cos(2.*polAngle), polFrac*np.sin(2.*polAngle), np.zeros(polFrac.shape)], axis=-1)
         
     #Convert from central frequncy and fractional bandwidth to band edges
     def bandEdges(self, freqCent, fracBw):
@@ -133,7 +133,7 @@ class Physics:
 
     #Convert from degrees to radians
     def degToRad(self, deg):
-        return (float(deg)/360.)*2*self.PI
+        return (np.asarray(deg, dtype=np.float64)/360.)*2*self.PI
     
     #Convert radian to degree
     def radToDeg(self, rad):
@@ -1,10 +1,18 @@
 #Using python 2.7.2
 import numpy             as np
-import matplotlib.pyplot as plt
+import pickle            as pkl
+import subprocess        as sp
+import sys               as sy
+import tempfile          as tf
 import                      os
 
+#matplotlib.pyplot, imported on first use so that headless runs never load it
+plt = None
+
+#Trapezoidal integration, renamed from trapz in numpy 2
+trapz = np.trapezoid if hasattr(np, 'trapezoid') else np.trapz
+
 #Custom classes
-import src.measurement   as ms
 import src.unit          as un
 
 class Plot:
@@ -17,6 +25,9 @@ class Plot:
         else:
             self.saveLoc = saveLoc+os.sep
         self.opBands = opBands
+        global plt
+        if plt is None:
+            import matplotlib.pyplot as plt
         #Measurement handles
         #self.meas        = ms.Measurement()
         #self.measHandles = self.meas.app.values()
@@ -49,9 +60,9 @@ class Plot:
             #Calculate the band-averaged transmission
             for i in range(len(self.bandLo)):
                 mask = (sim.outputs[0] > self.bandLo[i])*(sim.outputs[0] < self.bandHi[i])
-                mean_ba = np.trapz(np.mean([sim.outputs[1][mask], sim.outputs[4][mask]], axis=0), sim.outputs[0][mask])/(sim.outputs[0][mask][-1] - sim.outputs[0][mask][0])
-                lo_ba  = np.trapz(np.mean([sim.outputs[2][mask], sim.outputs[5][mask]], axis=0), sim.outputs[0][mask])/(sim.outputs[0][mask][-1] - sim.outputs[0][mask][0])
-                hi_ba  = np.trapz(np.mean([sim.outputs[3][mask], sim.outputs[6][mask]], axis=0), sim.outputs[0][mask])/(sim.outputs[0][mask][-1] - sim.outputs[0][mask][0])
+                mean_ba = trapz(np.mean([sim.outputs[1][mask], sim.outputs[4][mask]], axis=0), sim.outputs[0][mask])/(sim.outputs[0][mask][-1] - sim.outputs[0][mask][0])
+                lo_ba  = trapz(np.mean([sim.outputs[2][mask], sim.outputs[5][mask]], axis=0), sim.outputs[0][mask])/(sim.outputs[0][mask][-1] - sim.outputs[0][mask][0])
+                hi_ba  = trapz(np.mean([sim.outputs[3][mask], sim.outputs[6][mask]], axis=0), sim.outputs[0][mask])/(sim.outputs[0][mask][-1] - sim.outputs[0][mask][0])
                 print ('%.1f GHz Band Transmission for %s = %.3f + %.3f / - %.3f' % (self.bandCenters[i], sim.fhandle, mean_ba, hi_ba-mean_ba, mean_ba-lo_ba))
 
         #Overplot the data
@@ -85,9 +96,9 @@ class Plot:
             #Calculate the band-averaged reflction
             for i in range(len(self.bandLo)):
                 mask = (sim.outputs[0] > self.bandLo[i])*(sim.outputs[0] < self.bandHi[i])
-                mean_ba = np.trapz(np.mean([sim.outputs[7][mask], sim.outputs[10][mask]], axis=0), sim.outputs[0][mask])/(sim.outputs[0][mask][-1] - sim.outputs[0][mask][0])
-                lo_ba  = np.trapz(np.mean([sim.outputs[8][mask], sim.outputs[11][mask]], axis=0), sim.outputs[0][mask])/(sim.outputs[0][mask][-1] - sim.outputs[0][mask][0])
-                hi_ba  = np.trapz(np.mean([sim.outputs[9][mask], sim.outputs[12][mask]], axis=0), sim.outputs[0][mask])/(sim.outputs[0][mask][-1] - sim.outputs[0][mask][0])
+                mean_ba = trapz(np.mean([sim.outputs[7][mask], sim.outputs[10][mask]], axis=0), sim.outputs[0][mask])/(sim.outputs[0][mask][-1] - sim.outputs[0][mask][0])
+                lo_ba  = trapz(np.mean([sim.outputs[8][mask], sim.outputs[11][mask]], axis=0), sim.outputs[0][mask])/(sim.outputs[0][mask][-1] - sim.outputs[0][mask][0])
+                hi_ba  = trapz(np.mean([sim.outputs[9][mask], sim.outputs[12][mask]], axis=0), sim.outputs[0][mask])/(sim.outputs[0][mask][-1] - sim.outputs[0][mask][0])
                 print ('%.1f GHz Band Reflection for %s = %.3f + %.3f / - %.3f' % (self.bandCenters[i], sim.fhandle, mean_ba, hi_ba-mean_ba, mean_ba-lo_ba))
 
         #Overplot the data
@@ -222,3 +233,24 @@ class Plot:
         return 1
 
     #Function for 
+
+#Render the transmission and reflection plots in a detached process that outlives the caller, so that
+#the plots never hold up a run whose numeric outputs are already written. The simulations and data are
+#handed over through a temporary pickle file, which the process removes once loaded
+def plotBackground(sims, dats, saveLoc=None):
+    fd, fname = tf.mkstemp(prefix='plot_', suffix='.pkl')
+    with os.fdopen(fd, 'wb') as f:
+        pkl.dump((sims, dats, saveLoc), f, protocol=pkl.HIGHEST_PROTOCOL)
+    env = dict(os.environ)
+    env.setdefault('MPLBACKEND', 'Agg')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return sp.Popen([sy.executable, '-m', 'src.plot', fname], cwd=root, env=env, start_new_session=True)
+
+#Entry point of the background plotting process
+if __name__ == '__main__':
+    with open(sy.argv[1], 'rb') as f:
+        sims, dats, saveLoc = pkl.load(f)
+    os.remove(sy.argv[1])
+    plot = Plot(sims, dats, saveLoc=saveLoc)
+    plot.plotTrans()
+    plot.plotRefl()
@@ -0,0 +1,190 @@
+#Using python 2.7.2
+import numpy as np
+
+#Class for reducing Monte Carlo spectra to the median, 5%, and 95% spectra, each being the trial
+#whose band-averaged value is closest to that percentile of the band-averaged values of all trials.
+#Without bands, the outputs are averaged over every frequency
+class Reducer:
+    def __init__(self, freqs, bandCenters, bandwidths, numGroups=8):
+        #Percentiles to be selected
+        self.percs = np.array([50., 5., 95.])
+        #Number of trial groups used to estimate the convergence error
+        self.numGroups = numGroups
+        #Number of trials reduced so far
+        self.numTrials = 0
+
+        #Mask of frequencies within the bands
+        self.freqs = freqs
+        if bandCenters is None:
+            self.mask = np.array([True]*len(self.freqs))
+        else:
+            band_lo = bandCenters*(1. - 0.5*bandwidths)
+            band_hi = bandCenters*(1. + 0.5*bandwidths)
+            self.mask = np.array([False]*len(self.freqs))
+            for j in range(len(band_lo)):
+                self.mask = np.logical_or((self.freqs < band_hi[j])*(self.freqs > band_lo[j]), self.mask)
+
+        #Stored spectra and band-averaged values
+        self.__outs = []
+        self.__bas  = []
+
+    # ***** Public Methods *****
+    #Band-averaged value of each trial, shape (outputs, trials)
+    def bandAvg(self, outs):
+        return np.mean(outs[:,:,self.mask], axis=-1)
+
+    #Add a (outputs, trials, freqs) block of trial spectra
+    def update(self, outs):
+        self.__outs.append(outs)
+        self.__bas.append(self.bandAvg(outs))
+        self.numTrials += outs.shape[1]
+
+    #Band-averaged values of every trial reduced so far, shape (outputs, trials)
+    def bandAvgs(self):
+        return np.concatenate(self.__bas, axis=1)
+
+    #Spectra of every trial reduced so far, shape (outputs, trials, freqs)
+    def trials(self):
+        if len(self.__outs) == 1:
+            return self.__outs[0]
+        return np.concatenate(self.__outs, axis=1)
+
+    #Median, 5%, and 95% spectra, shape (outputs, 3, freqs)
+    def finalize(self):
+        if len(self.__outs) == 1:
+            outs = self.__outs[0]
+        else:
+            outs = np.concatenate(self.__outs, axis=1)
+        bas = self.bandAvgs()
+        ret = np.zeros((outs.shape[0], len(self.percs), outs.shape[2]))
+        for i in range(outs.shape[0]):
+            if self.numTrials == 1:
+                ret[i,0] = outs[i,0]
+                continue
+            for j in range(len(self.percs)):
+                ind = np.argmin(abs(bas[i] - np.percentile(bas[i], self.percs[j])))
+                ret[i,j] = outs[i,ind]
+        return ret
+
+    #Standard error of the band-averaged median, 5%, and 95% values from contiguous groups of trials, shape (outputs, 3)
+    def convErr(self):
+        bas = self.bandAvgs()
+        if self.numTrials < 2*self.numGroups:
+            return np.full((bas.shape[0], len(self.percs)), np.nan)
+        groups = np.array_split(bas, self.numGroups, axis=1)
+        percs = np.array([np.percentile(group, self.percs, axis=1).T for group in groups])
+        return np.std(percs, axis=0, ddof=1)/np.sqrt(self.numGroups)
+
+#Class for reducing Monte Carlo spectra in memory that does not grow with the number of trials.
+#Percentiles of the band-averaged values are tracked with a t-digest, and for each output and
+#percentile only the spectra of the trials closest to the running estimate are kept
+class StreamReducer(Reducer):
+    def __init__(self, freqs, bandCenters, bandwidths, numCandidates=16, compression=200):
+        Reducer.__init__(self, freqs, bandCenters, bandwidths)
+        #Number of candidate spectra kept for each output and percentile
+        self.numCandidates = numCandidates
+        self.compression = compression
+
+        #Per-output digests and candidate trials
+        self.__digests  = None
+        self.__candBas  = None
+        self.__candOuts = None
+        #Exact percentiles of each block, used for the convergence error
+        self.__blockPercs = []
+
+    # ***** Public Methods *****
+    #Add a (outputs, trials, freqs) block of trial spectra
+    def update(self, outs):
+        numOuts = outs.shape[0]
+        if self.__digests is None:
+            self.__digests  = [Digest(self.compression) for i in range(numOuts)]
+            self.__candBas  = [[np.empty(0) for j in range(len(self.percs))] for i in range(numOuts)]
+            self.__candOuts = [[np.empty((0, outs.shape[2])) for j in range(len(self.percs))] for i in range(numOuts)]
+        bas = self.bandAvg(outs)
+        self.__blockPercs.append(np.percentile(bas, self.percs, axis=1).T)
+        for i in range(numOuts):
+            self.__digests[i].update(bas[i])
+            ests = self.__digests[i].percentile(self.percs)
+            for j in range(len(self.percs)):
+                #Earlier trials stay ahead of later ones on ties, as in the exact selection
+                candBas  = np.concatenate([self.__candBas[i][j], bas[i]])
+                candOuts = np.concatenate([self.__candOuts[i][j], outs[i]])
+                keep = np.sort(np.argsort(abs(candBas - ests[j]), kind='stable')[:self.numCandidates])
+                self.__candBas[i][j]  = candBas[keep]
+                self.__candOuts[i][j] = candOuts[keep]
+        self.numTrials += outs.shape[1]
+
+    #Per-trial values are not kept when streaming
+    def bandAvgs(self):
+        return None
+
+    def trials(self):
+        return None
+
+    #Median, 5%, and 95% spectra, shape (outputs, 3, freqs)
+    def finalize(self):
+        numOuts = len(self.__digests)
+        ret = np.zeros((numOuts, len(self.percs), len(self.freqs)))
+        for i in range(numOuts):
+            ests = self.__digests[i].percentile(self.percs)
+            for j in range(len(self.percs)):
+                if self.numTrials == 1 and j:
+                    continue
+                ind = np.argmin(abs(self.__candBas[i][j] - ests[j]))
+                ret[i,j] = self.__candOuts[i][j][ind]
+        return ret
+
+    #Standard error of the band-averaged median, 5%, and 95% values from the spread between blocks, shape (outputs, 3)
+    def convErr(self):
+        if len(self.__blockPercs) < 2:
+            return np.full((len(self.__digests), len(self.percs)), np.nan)
+        percs = np.array(self.__blockPercs)
+        return np.std(percs, axis=0, ddof=1)/np.sqrt(len(percs))
+
+#Class for a merging t-digest, a bounded-size summary of a distribution for percentile estimates
+class Digest:
+    def __init__(self, compression=200):
+        self.compression = compression
+        #Centroid means and weights, sorted by mean
+        self.means   = np.empty(0)
+        self.weights = np.empty(0)
+        #Exact extremes
+        self.min = np.inf
+        self.max = -np.inf
+
+    # ***** Public Methods *****
+    #Add an array of values
+    def update(self, vals):
+        vals = np.asarray(vals, dtype=np.float64)
+        vals = vals[~np.isnan(vals)]
+        if not len(vals):
+            return
+        self.min = min(self.min, np.amin(vals))
+        self.max = max(self.max, np.amax(vals))
+        means   = np.concatenate([self.means, vals])
+        weights = np.concatenate([self.weights, np.ones(len(vals))])
+        order = np.argsort(means, kind='stable')
+        means = means[order]; weights = weights[order]
+        #Merge neighbouring centroids that fall in the same unit of the k1 scale function,
+        #which keeps clusters small in the tails where the 5% and 95% values are read off
+        if len(means) > self.compression:
+            total = np.sum(weights)
+            qMid = (np.cumsum(weights) - 0.5*weights)/total
+            k = np.floor(self.compression/(2.*np.pi)*np.arcsin(2.*qMid - 1.))
+            starts = np.flatnonzero(np.concatenate([[True], k[1:] != k[:-1]]))
+            sums    = np.add.reduceat(means*weights, starts)
+            weights = np.add.reduceat(weights, starts)
+            means   = sums/weights
+        self.means = means; self.weights = weights
+
+    #Estimated percentiles [%]
+    def percentile(self, percs):
+        percs = np.asarray(percs, dtype=np.float64)
+        if not len(self.means):
+            return np.full(percs.shape, np.nan)
+        #Exact while no centroids have been merged
+        if np.all(self.weights == 1.):
+            return np.percentile(self.means, percs)
+        total = np.sum(self.weights)
+        centers = (np.cumsum(self.weights) - 0.5*self.weights)/total
+        return np.interp(percs/100., np.concatenate([[0.], centers, [1.]]), np.concatenate([[self.min], self.means, [self.max]]))
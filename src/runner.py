@@ -0,0 +1,194 @@
+#Using python 2.7.2
+import numpy              as np
+import concurrent.futures as cf
+import json               as js
+import time               as tm
+import                       os
+
+#Custom classes
+import src.batch    as bt
+import src.hou      as ho
+import src.simulate as sm
+
+#Output columns, as Simulate attribute names, header labels, and units
+columns = sm.columns
+labels  = ['Freq [GHz]',
+           'P Trans',  'P Trans 5%',  'P Trans 95%',  'S Trans',  'S Trans 5%',  'S Trans 95%',
+           'P Refl',   'P Refl 5%',   'P Refl 95%',   'S Refl',   'S Refl 5%',   'S Refl 95%',
+           'P Absorb', 'P Absorb 5%', 'P Absorb 95%', 'S Absorb', 'S Absorb 5%', 'S Absorb 95%']
+units   = ['GHz'] + ['']*18
+#Outputs along the leading axis of the per-trial arrays
+trialLabels = ['P Trans', 'S Trans', 'P Refl', 'S Refl', 'P Absorb', 'S Absorb']
+
+#Allowed output formats
+outFormats = ['TXT', 'NPZ', 'NPY']
+
+#Default save header, aligned with the '%-12.4f' columns after the '# ' comment marker
+saveHdr = ("%-11s" % (labels[0])) + ''.join(["%-13s" % (label) for label in labels[1:]])
+
+#Write the simulated output of a Simulate object, returning the name of the main output file. 'TXT' writes
+#4-decimal text, 'NPZ' one archive of full-precision named columns and metadata, and 'NPY' a memory-mappable
+#(columns, freqs) array with a JSON sidecar. Simulations that kept their trials also write the per-trial
+#spectra, band averages, and sampled layers, inside the archive for 'NPZ' and as .npy files otherwise,
+#unless perTrial is False
+def writeOutput(sim, saveLoc, outFormat='TXT', perTrial=None):
+    outFormat = outFormat.upper()
+    if outFormat not in outFormats:
+        raise Exception("MICROWAVE TRANSMISSION ERROR: output format '%s' not understood. Allowed values = %s" % (outFormat, ', '.join(outFormats)))
+    base = ('%s%ssimOutput_%s' % (saveLoc, os.sep, sim.fhandle))
+    output = np.array(sim.outputs)
+    meta = metadata(sim)
+    trials = {}
+    if perTrial is None:
+        perTrial = sim.keepTrials
+    if perTrial and sim.keepTrials:
+        if sim.trials is not None:
+            trials["trials"] = sim.trials
+        if sim.bandAvgs is not None:
+            trials["bandAvgs"] = sim.bandAvgs
+        if sim.samples is not None:
+            trials["samples"] = sim.samples
+            meta["sampleLabels"] = sim.sampleLabels()
+
+    if outFormat == 'NPZ':
+        fname = base+'.npz'
+        arrays = dict([(columns[i], output[i]) for i in range(len(columns))])
+        arrays.update(trials)
+        np.savez(fname, meta=np.array(js.dumps(meta)), **arrays)
+        return fname
+
+    if outFormat == 'TXT':
+        fname = base+'.txt'
+        np.savetxt(fname, output.T, fmt="%-12.4f", header=("Num Trials = %d\n" % (sim.numTrialsUsed))+saveHdr)
+    else:
+        fname = base+'.npy'
+        np.save(fname, output)
+        meta["file"]  = os.path.basename(fname)
+        meta["shape"] = list(output.shape)
+        meta["dtype"] = str(output.dtype)
+    for key in trials:
+        tname = ('%s%ssim%s_%s.npy' % (saveLoc, os.sep, key[0].upper()+key[1:], sim.fhandle))
+        np.save(tname, trials[key])
+        meta[key+"File"] = os.path.basename(tname)
+    if outFormat == 'NPY':
+        with open(base+'.json', 'w') as f:
+            js.dump(meta, f, indent=2)
+    return fname
+
+#Column names, units, and run metadata of a Simulate object as a JSON-able dictionary
+def metadata(sim):
+    return {"layerFile":     sim.layerFile,
+            "simFile":       sim.simFile,
+            "columns":       columns,
+            "labels":        labels,
+            "units":         units,
+            "trialLabels":   trialLabels,
+            "numFreqs":      len(sim.freqs),
+            "numTrials":     sim.simInputs["Num Trials"],
+            "numTrialsUsed": sim.numTrialsUsed,
+            "converged":     sim.converged,
+            "cached":        sim.cached,
+            "convErr":       dict([(key, [jsonable(val) for val in sim.convErr[key]]) for key in sim.convErr]),
+            "engine":        sim.simInputs["Sim Method"].upper(),
+            "engineVersion": ho.version,
+            "bandCenters":   jsonable(sim.bandCenters),
+            "bandwidths":    jsonable(sim.bandwidths),
+            "simInputs":     dict([(key, jsonable(sim.simInputs[key])) for key in sim.simInputs]),
+            "layers":        [dict([("name", str(name).strip())]+[(key, jsonable(sim.layers.layers[name][key])) for key in sim.layers.layers[name]])
+                              for name in sim.layers.layers]}
+
+#JSON-able form of a simulation input, with parameters as their mean and spread in SI units and NaN as null
+def jsonable(val):
+    if hasattr(val, 'avg') and hasattr(val, 'std'):
+        return {"avg": jsonable(val.avg), "std": jsonable(val.std)}
+    elif isinstance(val, np.ndarray):
+        return [jsonable(v) for v in val.tolist()]
+    elif isinstance(val, (list, tuple)):
+        return [jsonable(v) for v in val]
+    elif isinstance(val, (bool, np.bool_)) or val is None:
+        return val
+    elif isinstance(val, (int, np.integer)):
+        return int(val)
+    elif isinstance(val, (float, np.floating)):
+        return None if np.isnan(val) else float(val)
+    else:
+        return str(val)
+
+#Evaluate one Simulate object and write its output, returning it along with the calculation and write times
+def runSim(args):
+    sim, saveLoc, outFormat, perTrial = args
+    start = tm.time()
+    sim.calc()
+    calcTime = tm.time() - start
+    start = tm.time()
+    writeOutput(sim, saveLoc, outFormat, perTrial)
+    return sim, calcTime, tm.time() - start
+
+#Class for running the simulations of many layer files, either in this process or across a pool of
+#worker processes with at most maxPending simulations queued or running at once. Trials kept by the
+#Simulate objects are written out unless perTrial is False, and are returned either way
+class Runner:
+    def __init__(self, numJobs=1, saveLoc='.', maxPending=None, outFormat='TXT', perTrial=None):
+        #Store passed parameters
+        self.numJobs = max(1, int(numJobs))
+        self.saveLoc = saveLoc
+        self.outFormat = outFormat
+        self.perTrial = perTrial
+        if maxPending is None:
+            self.maxPending = 2*self.numJobs
+        else:
+            self.maxPending = max(self.numJobs, int(maxPending))
+
+    # ***** Public Methods *****
+    #Evaluate and write out every Simulate object, returning them with their results in the passed order
+    def run(self, sims):
+        #Cached runs and nominal runs sharing layers are evaluated together first
+        start = tm.time()
+        left = bt.Batch(sims).calcShared()
+        done = [sim for sim in sims if sim not in left]
+        if len(done):
+            print ('Evaluated %d cached or shared runs in %.2f s' % (len(done), tm.time() - start))
+        for sim in done:
+            start = tm.time()
+            writeOutput(sim, self.saveLoc, self.outFormat, self.perTrial)
+            self.__report(sim, 0., tm.time() - start)
+
+        results = {}
+        if self.numJobs == 1 or len(left) <= 1:
+            for i in range(len(left)):
+                results[i] = self.__report(*runSim((left[i], self.saveLoc, self.outFormat, self.perTrial)))
+        else:
+            pool = cf.ProcessPoolExecutor(min(self.numJobs, len(left)))
+            try:
+                pending = {}
+                queued = iter(range(len(left)))
+                for i in queued:
+                    pending[pool.submit(runSim, (left[i], self.saveLoc, self.outFormat, self.perTrial))] = i
+                    #Wait for a slot before queueing more work
+                    while len(pending) >= self.maxPending:
+                        self.__collect(pending, results)
+                while len(pending):
+                    self.__collect(pending, results)
+            finally:
+                pool.shutdown()
+
+        #Worker processes return copies, which replace the passed objects
+        ret = list(sims)
+        for i in results:
+            ret[sims.index(left[i])] = results[i]
+        return ret
+
+    # ***** Private Methods *****
+    #Wait for at least one simulation to finish, storing it and reporting its timing
+    def __collect(self, pending, results):
+        finished, running = cf.wait(list(pending), return_when=cf.FIRST_COMPLETED)
+        for future in finished:
+            i = pending.pop(future)
+            results[i] = self.__report(*future.result())
+
+    def __report(self, sim, calcTime, writeTime):
+        if sim.cached:
+            print ('%s: loaded from cache, write %.2f s' % (sim.fhandle, writeTime))
+        else:
+            print ('%s: calc %.2f s, write %.2f s' % (sim.fhandle, calcTime, writeTime))
+        return sim
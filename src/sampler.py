@@ -0,0 +1,70 @@
+#Using python 2.7.2
+import numpy    as np
+import warnings as wn
+
+#Keyed 64-bit mix of a uint64 array, the splitmix64 finalizer, used as a counter-based random source
+def mix(x):
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30)))*np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27)))*np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+#Keyed pseudo-random permutation of [0, n) evaluated at the uint64 array i, without building the whole permutation.
+#A balanced Feistel network with a round per key permutes the smallest even-bit domain holding n, and values that
+#land outside [0, n) are walked through the network again until they fall inside it
+def permute(i, n, keys):
+    half = max(1, (int(n - 1).bit_length() + 1)//2)
+    mask = np.uint64((1 << half) - 1)
+    x = np.array(i, dtype=np.uint64)
+    todo = np.ones(x.shape, dtype=bool)
+    while np.any(todo):
+        L = x[todo] >> np.uint64(half); R = x[todo] & mask
+        for key in keys:
+            L, R = R, L ^ (mix(R ^ key) & mask)
+        x[todo] = (L << np.uint64(half)) | R
+        todo = x >= np.uint64(n)
+    return x
+
+#Class for drawing quasi-Monte Carlo points for tolerance runs
+class Sampler:
+    def __init__(self, mode, numDims, numTrials, seed=None):
+        #Allowed sampling modes. 'PLAIN' trials are drawn directly from a Generator instead
+        self.modes = ['LHS', 'SOBOL']
+
+        #Store passed parameters
+        self.mode = mode.upper()
+        if self.mode not in self.modes:
+            raise Exception("MICROWAVE TRANSMISSION ERROR: Sample mode '%s' not understood. Allowed values = %s" % (mode, ', '.join(self.modes)))
+        self.numDims   = numDims
+        self.numTrials = numTrials
+        #Entropy shared by every process drawing from this sequence
+        self.entropy = np.random.SeedSequence(seed).entropy
+
+        #Keys of the Latin hypercube, as the rounds of each dimension's permutation of the strata and the key of its jitter
+        self.__lhsKeys = np.random.SeedSequence(self.entropy).generate_state(5*numDims, dtype=np.uint64).reshape(numDims, 5)
+
+    # ***** Public Methods *****
+    #Uniform points for trials [start, stop), shape (stop - start, numDims). Only the points of these trials are
+    #generated, so blocks of a run cost no more than their size, in any process
+    def uniform(self, start, stop):
+        if self.mode == 'SOBOL':
+            #Imported here, as scipy.stats is slow to load and only needed for quasi-Monte Carlo runs
+            from scipy.stats import qmc
+            rng = np.random.default_rng(self.entropy)
+            eng = qmc.Sobol(self.numDims, scramble=True, seed=rng)
+            if start:
+                eng.fast_forward(start)
+            #Balance warnings for non-power-of-two blocks are expected when the run is split
+            with wn.catch_warnings():
+                wn.simplefilter('ignore', UserWarning)
+                return eng.random(stop - start)
+        elif self.mode == 'LHS':
+            #Each trial takes its stratum from a keyed permutation of the strata of every dimension, which keeps the
+            #design stratified over the whole run, and a uniform jitter within the stratum from a counter-based hash
+            idx = np.arange(start, stop, dtype=np.uint64)
+            ret = np.empty((stop - start, self.numDims))
+            for d in range(self.numDims):
+                strata = permute(idx, self.numTrials, self.__lhsKeys[d,:4])
+                jitter = (mix(idx ^ self.__lhsKeys[d,4]) >> np.uint64(11))*2.**-53
+                ret[:,d] = (strata + jitter)/self.numTrials
+            return ret
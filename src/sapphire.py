@@ -7,6 +7,9 @@ import pickle as pkl
 import scipy.integrate as itg
 import copy
 
+#Custom classes
+from src.physics import Physics
+
 #Class for sapphire
 class Sapphire:
     def __init__(self):
@@ -0,0 +1,220 @@
+#Using python 2.7.2
+import numpy              as np
+import collections        as cl
+import concurrent.futures as cf
+import copy               as cp
+import json               as js
+import socketserver       as ss
+import threading          as th
+import time               as tm
+import sys                as sy
+import                       os
+
+#Custom classes
+import src.simulate as sm
+import src.runner   as rn
+
+#Class for a long-running simulation server. Jobs arrive as JSON lines, either on a stream such as stdin or
+#over a Unix socket, and run on a pool of worker threads. Each result is written back as one JSON line as
+#soon as it is done, so results may come back out of order and carry the id of their job. Parsed layer and
+#simulation files, with their frequency grids, and the results of cacheable runs are kept between jobs
+#
+#A job is a JSON object with the keys
+#  "id":         any value, echoed in the result
+#  "layerFile":  layer file to simulate
+#  "layers":     layer table to simulate instead, as rows of [name, thickness, index, loss tangent] or a
+#                dictionary of columns, with spreads written as in a layer file ("0.432 +/- 0.025")
+#  "simFile":    simulation input file. Default = the server's simFile
+#  "simInputs":  dictionary of simulation inputs, taking precedence over those in the simulation file
+#  "name":       name of the stack in the outputs. Default = the layer file name
+#  "save":       output format to also write to saveLoc, one of TXT, NPZ, NPY. Default = no file written
+#  "spectra":    whether to return the 19 output columns. Default = true
+#  "keepTrials": whether to keep the spectra and sampled layers of every trial, which are only written to saved files. Default = false
+#Each result holds "id" and "status" ("ok" or "error"), then either "error" or the run metadata as written
+#by the binary output formats, with the calculation time, the saved file, and the spectra. A job of
+#{"cmd": "stats"} returns the server counters, and {"cmd": "shutdown"} stops a socket server
+class Server:
+    def __init__(self, numWorkers=1, simFile=None, cacheDir=None, saveLoc='.', maxConfigs=256, maxResults=1024):
+        #Store passed parameters
+        self.numWorkers = max(1, int(numWorkers))
+        self.simFile    = simFile
+        self.cacheDir   = cacheDir
+        self.saveLoc    = saveLoc
+        self.maxConfigs = maxConfigs
+        self.maxResults = maxResults
+
+        #Parsed simulations keyed by file paths and modification times, and finished runs keyed by their cache key
+        self.__configs = cl.OrderedDict({})
+        self.__results = cl.OrderedDict({})
+        self.__lock = th.Lock()
+        #Jobs queued or running are bounded so that a fast client cannot grow memory without limit
+        self.__slots = th.BoundedSemaphore(4*self.numWorkers)
+        self.__pool = cf.ThreadPoolExecutor(self.numWorkers)
+        self.__socket = None
+
+        #Counters
+        self.numJobs = 0
+        self.numErrors = 0
+        self.numConfigHits = 0
+        self.numResultHits = 0
+
+    # ***** Public Methods *****
+    #Serve jobs from an iterable of JSON lines, passing each JSON result line to write. Returns once every job is done
+    def serve(self, lines, write):
+        writeLock = th.Lock()
+        def reply(result):
+            line = js.dumps(result)
+            with writeLock:
+                write(line+'\n')
+        futures = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = js.loads(line)
+                if not isinstance(job, dict):
+                    raise ValueError('job must be a JSON object')
+            except ValueError as e:
+                reply({"id": None, "status": "error", "error": "could not parse job: %s" % (e)})
+                continue
+            cmd = str(job.get("cmd", "RUN")).upper()
+            if cmd == 'STATS':
+                reply(dict([("id", job.get("id")), ("status", "ok")]+list(self.stats().items())))
+            elif cmd == 'SHUTDOWN':
+                reply({"id": job.get("id"), "status": "ok"})
+                if self.__socket is not None:
+                    th.Thread(target=self.__socket.shutdown).start()
+                break
+            elif cmd == 'RUN':
+                self.__slots.acquire()
+                future = self.__pool.submit(self.run, job)
+                future.add_done_callback(lambda f: (self.__slots.release(), reply(f.result())))
+                futures.append(future)
+            else:
+                reply({"id": job.get("id"), "status": "error", "error": "command '%s' not understood. Allowed values = RUN, STATS, SHUTDOWN" % (cmd)})
+            #Drop finished jobs
+            futures = [future for future in futures if not future.done()]
+        cf.wait(futures)
+
+    #Serve jobs from stdin, writing results to stdout
+    def serveStdio(self):
+        def write(line):
+            sy.stdout.write(line)
+            sy.stdout.flush()
+        self.serve(sy.stdin, write)
+
+    #Serve jobs over a Unix socket at path until a shutdown job arrives, with one thread per connection
+    def serveSocket(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+        server = self
+        class Handler(ss.StreamRequestHandler):
+            def handle(self):
+                def write(line):
+                    self.wfile.write(line.encode('utf-8'))
+                    self.wfile.flush()
+                server.serve((line.decode('utf-8') for line in self.rfile), write)
+        self.__socket = ss.ThreadingUnixStreamServer(path, Handler)
+        try:
+            self.__socket.serve_forever()
+        finally:
+            self.__socket.server_close()
+            self.__socket = None
+            os.remove(path)
+
+    #Run one job, returning its result
+    def run(self, job):
+        jobId = job.get("id")
+        try:
+            start = tm.time()
+            sim = self.__simulate(job)
+            key = sim.cacheKey()
+            with self.__lock:
+                self.numJobs += 1
+                done = self.__results.get(key) if key is not None and not sim.keepTrials else None
+                if done is not None:
+                    self.__results.move_to_end(key)
+                    self.numResultHits += 1
+            if done is None:
+                sim.calc()
+                if key is not None and not sim.keepTrials:
+                    with self.__lock:
+                        self.__results[key] = sim
+                        while len(self.__results) > self.maxResults:
+                            self.__results.popitem(last=False)
+            else:
+                #The same stack may be run under another name
+                fhandle = sim.fhandle
+                sim = cp.copy(done)
+                sim.fhandle = fhandle
+            result = dict([("id", jobId), ("status", "ok")]+list(rn.metadata(sim).items()))
+            result["calcTime"] = tm.time() - start
+            if job.get("save"):
+                result["file"] = rn.writeOutput(sim, self.saveLoc, str(job["save"]))
+            if job.get("spectra", True):
+                result["spectra"] = rn.jsonable(np.array(sim.outputs))
+            return result
+        #Errors, such as a ConfigError naming the bad file and line, are reported in the result
+        except Exception as e:
+            with self.__lock:
+                self.numErrors += 1
+            return {"id": jobId, "status": "error", "error": str(e).strip()}
+
+    #Server counters
+    def stats(self):
+        with self.__lock:
+            return {"numJobs":       self.numJobs,
+                    "numErrors":     self.numErrors,
+                    "numConfigHits": self.numConfigHits,
+                    "numResultHits": self.numResultHits,
+                    "numConfigs":    len(self.__configs),
+                    "numResults":    len(self.__results)}
+
+    #Stop the worker pool once running jobs are done
+    def close(self):
+        self.__pool.shutdown(wait=True)
+
+    # ***** Private Methods *****
+    #Fresh Simulate object for a job. Parsing is done once per version of the input files, and every job gets a
+    #shallow copy of the parsed object, which the calculation only adds attributes to
+    def __simulate(self, job):
+        if "layerFile" not in job and "layers" not in job:
+            raise Exception("MICROWAVE TRANSMISSION ERROR: job has neither 'layerFile' nor 'layers'")
+        simFile = job.get("simFile", self.simFile)
+        if simFile is not None:
+            simFile = os.path.abspath(simFile)
+        #Stacks and inputs passed in the job are cheap to parse, and only cached through their results
+        if "layers" in job or "simInputs" in job:
+            layerFile = job.get("layerFile")
+            if layerFile is not None:
+                layerFile = os.path.abspath(layerFile)
+            sim = sm.Simulate(layerFile=layerFile, simFile=simFile, cacheDir=self.cacheDir, keepTrials=bool(job.get("keepTrials", False)),
+                              layers=job.get("layers"), simInputs=job.get("simInputs"), name=job.get("name"))
+            return sim
+        layerFile = os.path.abspath(job["layerFile"])
+        key = (layerFile, self.__mtime(layerFile), simFile, self.__mtime(simFile))
+        with self.__lock:
+            template = self.__configs.get(key)
+            if template is not None:
+                self.__configs.move_to_end(key)
+                self.numConfigHits += 1
+        if template is None:
+            template = sm.Simulate(layerFile=layerFile, simFile=simFile, cacheDir=self.cacheDir)
+            with self.__lock:
+                self.__configs[key] = template
+                while len(self.__configs) > self.maxConfigs:
+                    self.__configs.popitem(last=False)
+        sim = cp.copy(template)
+        sim.keepTrials = bool(job.get("keepTrials", False))
+        if job.get("name") is not None:
+            sim.fhandle = job["name"]
+        return sim
+
+    def __mtime(self, fname):
+        if fname is None:
+            return None
+        try:
+            return os.stat(fname).st_mtime_ns
+        except OSError:
+            raise Exception("MICROWAVE TRANSMISSION ERROR: could not find file '%s'" % (fname))
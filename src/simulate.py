@@ -1,6 +1,6 @@
 #Using> python 2.7.2
 import numpy       as np
-import sys         as sy
+import warnings    as wn
 import                os
 
 #Custom classes
@@ -8,90 +8,243 @@ import src.layers     as ly
 import src.parameter  as pm
 import src.unit       as un
 import src.hou        as ho
+import src.parallel   as pa
+import src.sampler    as sa
+import src.reduce     as rd
+import src.cache      as ch
+import src.config     as cf
 
+#Output columns, as attribute names
+columns = ['freq',
+           'tran_p', 'tran_p_5', 'tran_p_95', 'tran_s', 'tran_s_5', 'tran_s_95',
+           'refl_p', 'refl_p_5', 'refl_p_95', 'refl_s', 'refl_s_5', 'refl_s_95',
+           'abso_p', 'abso_p_5', 'abso_p_95', 'abso_s', 'abso_s_5', 'abso_s_95']
+
+#Simulation inputs, required ones first
+inputNames = ["Inc Angle", "Inc Pol Angle", "Low Freq", "High Freq", "Freq Step", "Num Trials", "Sim Method", "Band Centers", "Bandwidths",
+              "Num Procs", "Seed", "Sample Mode", "Reduction", "Conv Tol"]
+
+#Class for simulating a stack from its layers and simulation inputs. The layers come from a layer file, or
+#from a Layers object or table passed as layers. The simulation inputs come from a simulation file, from a
+#dictionary of inputs keyed as in that file, or from both, with the dictionary taking precedence. Inputs are
+#given in the file's units, as numbers, (mean, spread) tuples, or strings as written in the file. The
+#default files are only read when neither alternative is passed
 class Simulate:
-    def __init__(self, layerFile=None, simFile=None):
+    def __init__(self, layerFile=None, simFile=None, cacheDir=None, keepTrials=False, layers=None, simInputs=None, name=None):
+        configDir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config')
         #Generate layers instance
-        if layerFile is None:
-            self.layerFile = os.path.abspath(__file__)+'..'+os.sep+'config'+os.sep+'layers'+os.sep+'layers.txt'
-        else:
+        if layers is not None:
             self.layerFile = layerFile
-        self.fhandle = self.layerFile.split('.')[0].split('/')[-1]
-        self.layers = ly.Layers(self.layerFile)
+            if isinstance(layers, ly.Layers):
+                self.layers = layers
+            else:
+                self.layers = ly.Layers(table=layers)
+        else:
+            if layerFile is None:
+                self.layerFile = os.path.join(configDir, 'layers', 'layers.txt')
+            else:
+                self.layerFile = layerFile
+            self.layers = ly.Layers(self.layerFile)
+        if name is not None:
+            self.fhandle = name
+        elif self.layerFile is not None:
+            self.fhandle = self.layerFile.split('.')[0].split('/')[-1]
+        else:
+            self.fhandle = 'stack'
 
         #Save input parameters
-        if simFile is None:
-            self.simFile = os.path.abspath(__file__)+'..'+os.sep+'config'+os.sep+'simulation'+os.sep+'simInputs.txt'
+        if simFile is None and simInputs is None:
+            self.simFile = os.path.join(configDir, 'simulation', 'simInputs.txt')
         else:
             self.simFile = simFile
-        #Load simulation input parameters
-        params, values = np.loadtxt(self.simFile, unpack=True, usecols=[1,3], comments='+-', delimiter='|', dtype=np.str)
-        params = [param.strip() for param in params]; values = [value.strip() for value in values]
-        self.simInputs = {"Inc Angle":     pm.Parameter("Inc Angle",     values[params.index("Inc Angle")],     min=-90.,    max=90.,    unit=un.deg_to_rad),
-                          "Inc Pol Angle": pm.Parameter("Inc Pol Angle", values[params.index("Inc Pol Angle")], min=-np.inf, max=np.inf, unit=un.deg_to_rad),
-                          "Low Freq":      pm.Parameter("Low Freq",      values[params.index("Low Freq")],      min=0.0,     max=np.inf, unit=un.GHz_to_Hz ),
-                          "High Freq":     pm.Parameter("High Freq",     values[params.index("High Freq")],     min=0.0,     max=np.inf, unit=un.GHz_to_Hz ),
-                          "Freq Step":     pm.Parameter("Freq Step",     values[params.index("Freq Step")],     min=1.e-4,   max=1.e12,  unit=un.GHz_to_Hz ),
-                          "Num Trials":                              int(values[params.index("Num Trials")]                                                ),
-                          "Sim Method":                              str(values[params.index("Sim Method")]                                                ),
-                          "Band Centers":  pm.Parameter("Band Centers", values[params.index("Band Centers")],  min=0.0,     max=np.inf, unit=un.GHz_to_Hz ),   
-                          "Bandwidths":    pm.Parameter("Bandwidths",   values[params.index("Bandwidths")],    min=0.0,     max=2.0                       )}
+        #Load simulation input parameters, parsed once per version of the file
+        try:
+            self.__parse(simInputs)
+        #Name the file in errors found past parsing, unless the inputs may have come from the dictionary
+        except cf.ConfigError as e:
+            if e.fname is None and self.simFile is not None and simInputs is None:
+                raise cf.ConfigError(e.message, self.simFile)
+            raise
         
+        #Maximum number of (trial, frequency) points evaluated per engine call
+        self.__batchElems = 2**18
+        #Confidence level of the convergence interval, in standard errors
+        self.__convSigma = 1.96
         #Set frequency array
         self.freqs = np.arange(self.simInputs["Low Freq"].getAvg(), self.simInputs["High Freq"].getAvg()+self.simInputs["Freq Step"].getAvg(), self.simInputs["Freq Step"].getAvg())
+
+        #Bands over which the outputs are averaged to select the median and percentile trials, or None for the whole grid
+        try:
+            self.bandCenters, self.bandwidths = self.__bands()
+        except cf.ConfigError as e:
+            if self.simFile is not None and simInputs is None:
+                raise cf.ConfigError(e.message, self.simFile)
+            raise
+
+        #Result cache. Runs without a fixed seed are never cached
+        if cacheDir is None:
+            self.cache = None
+        else:
+            self.cache = ch.Cache(cacheDir)
+        self.cached = False
+        #Whether to keep the spectra and sampled layers of every trial, which are not cached and are only kept by the exact reduction
+        self.keepTrials = keepTrials
+        self.trials = None
+        self.samples = None
     
-    #Run simulation
+    #Outputs as a structured array over frequency, with the fields named as the output attributes
+    def results(self):
+        ret = np.empty(len(self.freqs), dtype=[(column, np.float64) for column in columns])
+        for i in range(len(columns)):
+            ret[columns[i]] = self.outputs[i]
+        return ret
+
+    #Run simulation, returning cached results when the inputs match a previous run
     def calc(self):
         if self.simInputs["Sim Method"].upper() == 'HOU':
-            return self.houCalc()
+            if self.loadCache():
+                return True
+            ret = self.houCalc()
+            self.saveCache()
+            return ret
         else:
             print ("Error processing calculation in simulate.py")
             return 0
+
+    #Restore cached results for these inputs, returning whether they were found
+    def loadCache(self):
+        key = self.cacheKey()
+        if key is None or self.keepTrials:
+            return False
+        return self.__load(key)
+
+    #Store the current results in the cache, if the run is cacheable
+    def saveCache(self):
+        key = self.cacheKey()
+        if key is not None:
+            self.__save(key)
+
+    #Reduce a (6, trials, freqs) array of trial spectra evaluated elsewhere, with the nominal stack as the first trial
+    def setTrials(self, outs):
+        reducer = rd.Reducer(self.freqs, self.bandCenters, self.bandwidths)
+        reducer.update(outs)
+        self.numTrialsUsed = reducer.numTrials
+        self.bandAvgs = reducer.bandAvgs()
+        self.trials = outs if self.keepTrials else None
+        self.samples = self.nominalSample()[np.newaxis] if self.keepTrials else None
+        self.converged = None
+        self.__setOutputs(reducer.finalize(), reducer.convErr())
+
+    #Names of the columns of the sampled trials, ordered as the quasi-Monte Carlo dimensions, in SI units
+    def sampleLabels(self):
+        labels = []
+        for name in self.layers.layers:
+            labels += ['%s %s' % (str(name).strip(), param) for param in ["Thickness", "Index", "LossTan"]]
+        return labels+["Inc Angle"]
+
+    #Nominal stack and incident angle as a row of the sampled trials
+    def nominalSample(self):
+        thicks, indexes, lossTans = self.layers.getAvg()
+        ret = np.empty(3*len(thicks)+1)
+        ret[0:-1:3] = thicks; ret[1:-1:3] = indexes; ret[2:-1:3] = lossTans
+        ret[-1] = self.simInputs["Inc Angle"].getAvg()
+        return ret
+
+    #Hash of the parsed layers and simulation inputs, the engine, and the seed, or None if the run is not cacheable
+    def cacheKey(self):
+        if self.cache is None or self.simInputs["Seed"] is None:
+            return None
+        layers = [[name, self.layers.layers[name]] for name in self.layers.layers]
+        return self.cache.key(layers, self.simInputs, self.bandCenters, self.bandwidths,
+                              self.simInputs["Sim Method"].upper(), ho.version, self.simInputs["Seed"])
         
     #Simulate using Hou code
     def houCalc(self):
-        #Save transmission, reflection, and absorption
-        tran_p = []; tran_s = []
-        refl_p = []; refl_s = []
-        abso_p = []; abso_s = []
-        #Instantiate Hou object
-        hou = ho.Hou()
-        #Simulate over the specified number of iterations
-        for i in range(self.simInputs["Num Trials"]):
-            if not i:
-                #Sample the layers and incident angle
-                thicks, indexes, lossTans = self.layers.getAvg()
-                incAngle = self.simInputs["Inc Angle"].getAvg()
-            else:
-                #Sample the layers and incident angle
-                thicks, indexes, lossTans = self.layers.sample()
-                incAngle = self.simInputs["Inc Angle"].sample()                
-            #Calculate the transmission
-            freq, t_p, t_s, r_p, r_s, a_p, a_s = hou.calc(indexes, thicks, lossTans, self.freqs, incAngle)
-            tran_p.append(t_p); tran_s.append(t_s)
-            refl_p.append(r_p); refl_s.append(r_s)
-            abso_p.append(a_p); abso_s.append(a_s)
-        #Return all means and standard deviations
-        self.freqs = self.freqs
-        self.tran_p = self.__median(tran_p)
-        self.tran_p_5 = self.__perc(tran_p, 5.)
-        self.tran_p_95 = self.__perc(tran_p, 95.)
-        self.tran_s = self.__median(tran_s)
-        self.tran_s_5 = self.__perc(tran_s, 5.)
-        self.tran_s_95 = self.__perc(tran_s, 95.)
-        self.refl_p = self.__median(refl_p)
-        self.refl_p_5 = self.__perc(refl_p, 5.)
-        self.refl_p_95 = self.__perc(refl_p, 95.)
-        self.refl_s = self.__median(refl_s)
-        self.refl_s_5 = self.__perc(refl_s, 5.)
-        self.refl_s_95 = self.__perc(refl_s, 95.)
-        self.abso_p = self.__median(abso_p)
-        self.abso_p_5 = self.__perc(abso_p, 5.)
-        self.abso_p_95 = self.__perc(abso_p, 95.)
-        self.abso_s = self.__median(abso_s)
-        self.abso_s_5 = self.__perc(abso_s, 5.)
-        self.abso_s_95 = self.__perc(abso_s, 95.)
-        
+        numTrials = self.simInputs["Num Trials"]
+        numProcs  = max(1, min(self.simInputs["Num Procs"], numTrials))
+        #Random stream and, for quasi-Monte Carlo runs, the low-discrepancy sequence shared by all trials
+        seed = np.random.SeedSequence(self.simInputs["Seed"])
+        if self.simInputs["Sample Mode"] == 'PLAIN':
+            sampler = None
+        else:
+            sampler = sa.Sampler(self.simInputs["Sample Mode"], 3*len(self.layers.layers)+1, numTrials, seed.entropy)
+        #Reduce the trials as they are calculated. Streaming runs only hold one block of trial spectra at a time
+        #Adaptive runs also go block by block, treating Num Trials as a cap and stopping once converged
+        batchSize = max(1, self.__batchElems//len(self.freqs))
+        convTol = self.simInputs["Conv Tol"]
+        if self.simInputs["Reduction"] == 'STREAM':
+            reducer = rd.StreamReducer(self.freqs, self.bandCenters, self.bandwidths)
+        else:
+            reducer = rd.Reducer(self.freqs, self.bandCenters, self.bandwidths)
+        if self.simInputs["Reduction"] == 'STREAM' or convTol is not None:
+            blockSize = numProcs*batchSize
+        else:
+            blockSize = numTrials
+        rng = np.random.default_rng(seed)
+        self.converged = None
+        #Convergence half-width on the band averages, unknown until a block is reduced
+        halfWidth = np.nan
+        #Sampled layers of every trial, kept along with their spectra
+        keepSamples = self.keepTrials and self.simInputs["Reduction"] == 'EXACT'
+        numSamples = 3*len(self.layers.layers)+1 if keepSamples else 0
+        samples = []
+        #One process pool serves every block
+        par = pa.Parallel(numProcs) if numProcs > 1 else None
+        try:
+            for start in range(0, numTrials, blockSize):
+                stop = min(start + blockSize, numTrials)
+                #Calculate the transmission for this block, either in this process or split across the process pool
+                if par is not None:
+                    #Each worker gets its own random stream derived from the run seed
+                    outs, samps = par.run(self, start, stop, len(self.freqs), seed.spawn(numProcs), sampler, numSamples)
+                else:
+                    outs = np.empty((6, stop - start, len(self.freqs)))
+                    samps = np.empty((stop - start, numSamples)) if keepSamples else None
+                    self.runTrials(start, stop, outs, rng, sampler, offset=start, samples=samps)
+                if keepSamples:
+                    samples.append(samps)
+                reducer.update(outs)
+                del outs
+                #Stop once the confidence interval on every band-averaged median and percentile is within tolerance
+                if convTol is not None:
+                    halfWidth = self.__convSigma*reducer.convErr()
+                    self.converged = bool(np.all(np.isfinite(halfWidth)) and np.all(halfWidth <= convTol))
+                    if self.converged:
+                        break
+        finally:
+            if par is not None:
+                par.close()
+        #A convergence estimate that never became finite cannot meet the tolerance, so say why the run went to the cap
+        if convTol is not None and not self.converged and not np.all(np.isfinite(halfWidth)):
+            wn.warn("%s: convergence error is not finite after %d trials, so Conv Tol could not be checked and the run went to Num Trials. "
+                    "Raise Num Trials, or check the band-averaged outputs for NaN" % (self.fhandle, reducer.numTrials), RuntimeWarning)
+        #Number of trials actually evaluated, and their band-averaged values where kept
+        self.numTrialsUsed = reducer.numTrials
+        self.bandAvgs = reducer.bandAvgs()
+        self.trials = reducer.trials() if self.keepTrials else None
+        self.samples = np.concatenate(samples) if keepSamples else None
+
+        self.__setOutputs(reducer.finalize(), reducer.convErr())
+        return True
+
+    #Store the (outputs, 3, freqs) medians and percentiles and the (outputs, 3) convergence errors
+    def __setOutputs(self, spectra, convErr):
+        #Return all medians and percentiles
+        (self.tran_p, self.tran_p_5, self.tran_p_95,
+         self.tran_s, self.tran_s_5, self.tran_s_95,
+         self.refl_p, self.refl_p_5, self.refl_p_95,
+         self.refl_s, self.refl_s_5, self.refl_s_95,
+         self.abso_p, self.abso_p_5, self.abso_p_95,
+         self.abso_s, self.abso_s_5, self.abso_s_95) = np.reshape(spectra, (18, len(self.freqs)))
+
+        #Estimated convergence error on the band-averaged median, 5%, and 95% values
+        self.convErr = {"P Trans":  tuple(convErr[0]),
+                        "S Trans":  tuple(convErr[1]),
+                        "P Refl":   tuple(convErr[2]),
+                        "S Refl":   tuple(convErr[3]),
+                        "P Absorb": tuple(convErr[4]),
+                        "S Absorb": tuple(convErr[5])}
+
         self.outputs = (self.freqs*un.Hz_to_GHz,
                         self.tran_p, self.tran_p_5, self.tran_p_95,
                         self.tran_s, self.tran_s_5, self.tran_s_95,
@@ -99,41 +252,150 @@ class Simulate:
                         self.refl_s, self.refl_s_5, self.refl_s_95,
                         self.abso_p, self.abso_p_5, self.abso_p_95,
                         self.abso_s, self.abso_s_5, self.abso_s_95)
+
+    #Restore results from the cache, returning whether the entry was found
+    def __load(self, key):
+        entry = self.cache.load(key)
+        if entry is None:
+            return False
+        self.numTrialsUsed = int(entry["numTrialsUsed"])
+        self.converged = {-1: None, 0: False, 1: True}[int(entry["converged"])]
+        if "bandAvgs" in entry:
+            self.bandAvgs = entry["bandAvgs"]
+        else:
+            self.bandAvgs = None
+        self.__setOutputs(entry["spectra"], entry["convErr"])
+        self.cached = True
         return True
+
+    #Store the spectra and per-trial band averages in the cache
+    def __save(self, key):
+        entry = {"spectra":       np.reshape(self.outputs[1:], (6, 3, len(self.freqs))),
+                 "convErr":       np.array([self.convErr[k] for k in ["P Trans", "S Trans", "P Refl", "S Refl", "P Absorb", "S Absorb"]]),
+                 "numTrialsUsed": np.array(self.numTrialsUsed),
+                 "converged":     np.array({None: -1, False: 0, True: 1}[self.converged])}
+        if self.bandAvgs is not None:
+            entry["bandAvgs"] = self.bandAvgs.astype(np.float32)
+        self.cache.save(key, entry)
+        self.cached = False
     
-    #Function to find the percentile
-    def __median(self, arr):
-        if self.simInputs["Num Trials"] == 1:
-            return arr[0]
+    #Evaluate trials [start, stop) into rows [start - offset, stop - offset) of a (6, trials, freqs) output array, drawing
+    #samples from rng (a numpy Generator, or a seed to create one from) or from the points of a quasi-Monte Carlo sampler.
+    #The sampled layers and incident angle are also written to the same rows of a (trials, 3*layers+1) samples array if passed
+    def runTrials(self, start, stop, outs, rng=None, sampler=None, offset=0, samples=None):
+        rng = np.random.default_rng(rng)
+        #Instantiate Hou object
+        hou = ho.Hou()
+        #Evaluate in batches that bound the size of the (trials, freqs) arrays
+        batchSize = max(1, self.__batchElems//len(self.freqs))
+        for bStart in range(start, stop, batchSize):
+            bStop = min(bStart + batchSize, stop)
+            #Sample the layers and incident angle, with the nominal stack as the first trial
+            if sampler is None:
+                thicks, indexes, lossTans = self.layers.sample(bStop - bStart, rng)
+                incAngles = np.broadcast_to(self.simInputs["Inc Angle"].sample(nsample=bStop - bStart, rng=rng), (bStop - bStart,)).copy()
+            else:
+                u = sampler.uniform(bStart, bStop)
+                thicks, indexes, lossTans = self.layers.transform(u[:,:-1])
+                incAngles = np.broadcast_to(self.simInputs["Inc Angle"].transform(u[:,-1]), (bStop - bStart,)).copy()
+            if not bStart:
+                thicks[0], indexes[0], lossTans[0] = self.layers.getAvg()
+                incAngles[0] = self.simInputs["Inc Angle"].getAvg()
+            if samples is not None:
+                samps = samples[bStart-offset:bStop-offset]
+                samps[:,0:-1:3] = thicks; samps[:,1:-1:3] = indexes; samps[:,2:-1:3] = lossTans
+                samps[:,-1] = incAngles
+            outs[:, bStart-offset:bStop-offset] = hou.calcBatch(indexes, thicks, lossTans, self.freqs, incAngles, self.layers.repeats)[1:]
+        return outs
+
+    #Parse the simulation inputs from the simulation file and the dictionary of inputs
+    def __parse(self, simInputs):
+        if self.simFile is not None:
+            inputs = cf.parser.simInputs(self.simFile)
+            params = list(inputs.keys()); values = list(inputs.values())
         else:
-            bas = self.__ba(arr)
-            ba_med = np.median(bas)
-            ind = np.argmin(abs(bas - ba_med))
-            #ind = bas.index(ba_med)
-            return arr[ind]
-
-    #Function to find the percentile
-    def __perc(self, arr, perc):
-        if self.simInputs["Num Trials"] == 1:
-            return np.array(len(arr[0])*[0.])
+            params = []; values = []
+        if simInputs is not None:
+            for param in simInputs:
+                if param not in inputNames:
+                    raise cf.ConfigError("simulation input '%s' not understood. Allowed values = %s" % (param, ', '.join(inputNames)))
+                if param in params:
+                    values[params.index(param)] = simInputs[param]
+                else:
+                    params.append(param); values.append(simInputs[param])
+        for param in inputNames[:9]:
+            if param not in params:
+                raise cf.ConfigError("simulation input '%s' not given" % (param))
+        self.simInputs = {"Inc Angle":     pm.Parameter("Inc Angle",     values[params.index("Inc Angle")],     min=-90.,    max=90.,    unit=un.deg_to_rad),
+                          "Inc Pol Angle": pm.Parameter("Inc Pol Angle", values[params.index("Inc Pol Angle")], min=-np.inf, max=np.inf, unit=un.deg_to_rad),
+                          "Low Freq":      pm.Parameter("Low Freq",      values[params.index("Low Freq")],      min=0.0,     max=np.inf, unit=un.GHz_to_Hz ),
+                          "High Freq":     pm.Parameter("High Freq",     values[params.index("High Freq")],     min=0.0,     max=np.inf, unit=un.GHz_to_Hz ),
+                          "Freq Step":     pm.Parameter("Freq Step",     values[params.index("Freq Step")],     min=1.e-4,   max=1.e12,  unit=un.GHz_to_Hz ),
+                          "Num Trials":                              self.__int("Num Trials", values[params.index("Num Trials")]                            ),
+                          "Sim Method":                              str(values[params.index("Sim Method")]                                                ),
+                          "Band Centers":  pm.Parameter("Band Centers", values[params.index("Band Centers")],  min=0.0,     max=np.inf, unit=un.GHz_to_Hz ),   
+                          "Bandwidths":    pm.Parameter("Bandwidths",   values[params.index("Bandwidths")],    min=0.0,     max=2.0                       ),
+                          "Num Procs":                               self.__int("Num Procs", self.__optional(params, values, "Num Procs", 1)                ),
+                          "Seed":                                    self.__seed(self.__optional(params, values, "Seed", 'NA')                              ),
+                          "Sample Mode":                             str(self.__optional(params, values, "Sample Mode", 'PLAIN')).upper(),
+                          "Reduction":                               str(self.__optional(params, values, "Reduction", 'EXACT')).upper(),
+                          "Conv Tol":                                self.__tol(self.__optional(params, values, "Conv Tol", 'NA')                           )}
+        if self.simInputs["Sample Mode"] not in ['PLAIN', 'LHS', 'SOBOL']:
+            raise cf.ConfigError("Sample Mode '%s' not understood. Allowed values = PLAIN, LHS, SOBOL" % (self.simInputs["Sample Mode"]))
+        if self.simInputs["Reduction"] not in ['EXACT', 'STREAM']:
+            raise cf.ConfigError("Reduction '%s' not understood. Allowed values = EXACT, STREAM" % (self.simInputs["Reduction"]))
+        if self.simInputs["Num Trials"] < 1:
+            raise cf.ConfigError("Num Trials must be at least 1, not %d" % (self.simInputs["Num Trials"]))
+        if self.simInputs["Conv Tol"] is not None and self.simInputs["Conv Tol"] <= 0.:
+            raise cf.ConfigError("Conv Tol must be positive or 'NA'")
+
+    #Function to parse the band centers and bandwidths, checking that every band holds simulated frequencies
+    def __bands(self):
+        if self.simInputs["Band Centers"].isEmpty() and self.simInputs["Bandwidths"].isEmpty():
+            return None, None
+        if self.simInputs["Band Centers"].isEmpty() or self.simInputs["Bandwidths"].isEmpty():
+            raise cf.ConfigError("Band Centers and Bandwidths must both be given or both be 'NA'")
+        centers = np.atleast_1d(np.array(self.simInputs["Band Centers"].avg, dtype=np.float64))
+        widths  = np.atleast_1d(np.array(self.simInputs["Bandwidths"].avg,   dtype=np.float64))
+        if len(centers) != len(widths):
+            raise cf.ConfigError("%d Band Centers given with %d Bandwidths" % (len(centers), len(widths)))
+        for center, width in zip(centers, widths):
+            if not np.any((self.freqs > center*(1. - 0.5*width))*(self.freqs < center*(1. + 0.5*width))):
+                raise cf.ConfigError("band at %.1f GHz with bandwidth %.3f holds no frequencies between Low Freq and High Freq" % (center*un.Hz_to_GHz, width))
+        return centers, widths
+
+    #Function to look up an optional simulation input
+    def __optional(self, params, values, param, default):
+        if param in params:
+            return values[params.index(param)]
+        else:
+            return default
+
+    #Function to parse the convergence tolerance
+    def __tol(self, val):
+        if val is None or 'NA' in str(val).upper():
+            return None
         else:
-            bas = self.__ba(arr)
-            ba_per = np.percentile(bas, perc)
-            ind = np.argmin(abs(bas - ba_per))
-            return arr[ind]
-
-    #Function to find the band-averaged reflection
-    def __ba(self, arr):
-        self.bandCenters = np.array([89.5, 147.8])*1.e9
-        self.bandwidths  = np.array([0.324,0.260])
-        band_lo = self.bandCenters*(1. - 0.5*self.bandwidths)
-        band_hi = self.bandCenters*(1. + 0.5*self.bandwidths)
-        #Find average of each value within each band
-        bas = []
-        for i in range(len(arr)):
-            mask = np.array([False]*len(self.freqs))
-            for j in range(len(band_lo)):
-                mask = np.logical_or((self.freqs < band_hi[j])*(self.freqs > band_lo[j]), mask)
-            ba = np.mean(arr[i][mask])
-            bas.append(ba)
-        return bas
+            return float(val)
+
+    #Function to parse the run seed
+    def __seed(self, val):
+        if val is None or 'NA' in str(val).upper():
+            return None
+        else:
+            return self.__int("Seed", val)
+
+    #Function to parse a whole-number simulation input
+    def __int(self, param, val):
+        if isinstance(val, (int, np.integer)):
+            return int(val)
+        try:
+            return int(str(val).strip())
+        except ValueError:
+            pass
+        try:
+            if float(val).is_integer():
+                return int(float(val))
+        except (TypeError, ValueError):
+            pass
+        raise cf.ConfigError("simulation input '%s' must be a whole number, not '%s'" % (param, str(val)))
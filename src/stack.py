@@ -0,0 +1,91 @@
+#Using python 2.7.2
+import numpy as np
+
+#Custom classes
+import src.hou as ho
+
+#Class for a dielectric stack whose Hou transfer matrix is kept up to date as layers change.
+#The element matrices (interface 0, then propagation through layer i followed by interface i)
+#sit at the leaves of a segment tree over the frequency grid, with every node holding the
+#ordered product of its children, so changing one layer costs O(log layers) matrix products
+class Stack:
+    def __init__(self, nArr, dArr, ltArr, freqArr, incAng=0.):
+        #Store passed parameters
+        self.n  = np.array(nArr,  dtype=np.float64)
+        self.d  = np.array(dArr,  dtype=np.float64)
+        self.lt = np.array(ltArr, dtype=np.float64)
+        if not (self.n.shape == self.d.shape == self.lt.shape) or self.n.ndim != 1:
+            raise Exception('Error in Stack(): nArr, dArr, and ltArr must be 1D arrays of equal length')
+        if len(self.n) < 2:
+            raise Exception('Error in Stack(): at least two layers are needed to define an interface')
+        self.freqs  = np.asarray(freqArr, dtype=np.float64)
+        self.incAng = float(incAng)
+
+        #Segment tree with the elements as leaves, padded with identities up to a power of two
+        self.numEl = len(self.n) - 1
+        self.__size = 1
+        while self.__size < self.numEl:
+            self.__size *= 2
+        self.__tree = np.zeros((2*self.__size, 2, len(self.freqs), 2, 2), dtype=np.complex128)
+        self.__tree[...,0,0] = 1.
+        self.__tree[...,1,1] = 1.
+        self.__build()
+
+    # ***** Public Methods *****
+    #Change the index, thickness, and/or loss tangent of layer i and refresh the affected products
+    def update(self, i, n=None, d=None, lt=None):
+        if not (0 <= i < len(self.n)):
+            raise Exception('Error in Stack.update(): layer %d out of range' % (i))
+        if n is not None:
+            self.n[i] = n
+            #The incident medium sets the angle in every layer
+            if i == 0:
+                if d is not None:
+                    self.d[i] = d
+                if lt is not None:
+                    self.lt[i] = lt
+                self.__build()
+                return
+            self.cos[i] = self.__cos(self.n[i])
+        if d is not None:
+            self.d[i] = d
+        if lt is not None:
+            self.lt[i] = lt
+        #Layer i enters the interface behind it and its own propagation and interface
+        idx = np.array([j for j in [i-1, i] if 0 <= j < self.numEl])
+        self.__tree[self.__size+idx] = self.__elements(idx)
+        nodes = set((self.__size+idx)//2)
+        while nodes:
+            for node in nodes:
+                self.__tree[node] = ho.mul2(self.__tree[2*node], self.__tree[2*node+1])
+            nodes = set([node//2 for node in nodes if node > 1])
+
+    #Stack matrices, shape (pol, freqs, 2, 2) with the polarization ordered (s, p)
+    def matrix(self):
+        return self.__tree[1]
+
+    #Transmission, reflection, and absorption through the stack, as returned by Hou.calc()
+    def calc(self):
+        return (self.freqs,)+ho.spectra(self.matrix())
+
+    # ***** Private Methods *****
+    #Recalculate the layer angles and every node of the tree
+    def __build(self):
+        #Snell invariant n*sin(theta), which makes each layer's angle depend only on its own index
+        self.__snell = self.n[0]*np.sin(self.incAng)
+        self.cos = self.__cos(self.n)
+        self.__tree[self.__size:self.__size+self.numEl] = self.__elements(np.arange(self.numEl))
+        #Build each level of parent nodes with one batched product
+        lo = self.__size//2
+        while lo >= 1:
+            self.__tree[lo:2*lo] = ho.mul2(self.__tree[2*lo:4*lo:2], self.__tree[2*lo+1:4*lo:2])
+            lo //= 2
+
+    def __cos(self, n):
+        return np.cos(np.arcsin(self.__snell/n))
+
+    #Element matrices for the element indexes idx, shape (len(idx), pol, freqs, 2, 2)
+    def __elements(self, idx):
+        #No propagation through the incident medium
+        d = np.where(idx == 0, 0., self.d[idx])
+        return ho.elements(self.n[idx], self.cos[idx], d, self.lt[idx], self.n[idx+1], self.cos[idx+1], self.freqs)
@@ -7,14 +7,24 @@ import pickle as pkl
 import scipy.integrate as itg
 import copy
 
+#Custom classes
+from src.physics  import Physics
+from src.sapphire import Sapphire
+from src.hwp      import HWP
+
 #Class for an ideal HWP (normal incidence with internal reflections)
 #Code taken from Tomo's thesis
 class Tomo:
     def __init__(self):
         #Private objects
         self.__hwp = HWP()
+        self.__sp  = Sapphire()
         self.__ph  = Physics()
-        
+
+        #Memoized frequency-only factors, keyed by frequency grid, indexes, and thickness
+        self.__factorCache = {}
+        self.__maxFactorCache = 64
+
         return
 
     #****** Private functions *****
@@ -26,182 +36,151 @@ class Tomo:
 
     def __prop(self, nu, n, th):
         return np.exp(1j*self.__ph.thickToPhase(nu, th, n))
-        
+
     def __mprop(self, nu, n, th):
         return np.exp(-1j*self.__ph.thickToPhase(nu, th, n))
-    
-    def __M1(self, nu, no=None, ne=None):
-        if no == None:
-            no = self.__hwp.oN
-        if ne == None:
-            ne = self.__hwp.eN
-
-        Co = __Clamb(nu,no)
-        Ce = __Clamb(nu,ne)
-        M1Ret = np.matrix([[1,0,1,0],[0,1,0,1],[0,-Ce,0,Ce],[Co,0,-Co,0]])
+
+    #Frequency-only factors for an array of frequencies, shared by every plate and interface angle
+    def __factors(self, nu, no, ne, d):
+        key = (nu.tobytes(), float(no), float(ne), float(d))
+        if key not in self.__factorCache:
+            if len(self.__factorCache) >= self.__maxFactorCache:
+                self.__factorCache.clear()
+            self.__factorCache[key] = {"Co":  self.__Clamb(nu, no),
+                                       "Ce":  self.__Clamb(nu, ne),
+                                       "CC":  self.__Clamb(nu, 1.),
+                                       "Po":  self.__prop(nu, no, d),
+                                       "Pe":  self.__prop(nu, ne, d),
+                                       "mPo": self.__mprop(nu, no, d),
+                                       "mPe": self.__mprop(nu, ne, d)}
+        return self.__factorCache[key]
+
+    def __M1(self, f):
+        Co = f["Co"]
+        Ce = f["Ce"]
+        M1Ret = np.zeros(Co.shape+(4,4), dtype=np.complex128)
+        M1Ret[...,0,0] = 1.;  M1Ret[...,0,2] = 1.
+        M1Ret[...,1,1] = 1.;  M1Ret[...,1,3] = 1.
+        M1Ret[...,2,1] = -Ce; M1Ret[...,2,3] = Ce
+        M1Ret[...,3,0] = Co;  M1Ret[...,3,2] = -Co
         return M1Ret
-    
-    def __M2inv(self, nu, theta, no=None, ne=None, d=None):
-        if no == None:
-            no = self.__hwp.oN
-        if ne == None:
-            ne = self.__hwp.eN
-        if d == None:
-            d = self.__hwp.thickIdeal
 
+    def __M2inv(self, f, theta):
         theta = self.__ph.degToRad(theta)
-        Co = self.__Clamb(nu,no)
-        Ce = self.__Clamb(nu,ne)
-        Po = self.__prop(nu, no, d)
-        Pe = self.__prop(nu, ne, d)
-        mPo = self.__mprop(nu, no, d)
-        mPe = self.__mprop(nu, ne, d)
-        M2invRet = 0.5*np.matrix([[Po*np.cos(theta),   Po*np.sin(theta),  -Po*np.sin(theta)/Co, Po*np.cos(theta)/Co],
-                                  [-Pe*np.sin(theta),  Pe*np.cos(theta),  -Pe*np.cos(theta)/Ce, -Pe*np.sin(theta)/Ce],
-                                  [mPo*np.cos(theta),  mPo*np.sin(theta), mPo*np.sin(theta)/Co, -mPo*np.cos(theta)/Co],
-                                  [-mPe*np.sin(theta), mPe*np.cos(theta), mPe*np.cos(theta)/Ce, mPe*np.sin(theta)/Ce]])
-        return M2invRet
-    
-    def __m(self, nu, theta, no1=None, ne1=None, no2=None, ne2=None, d=None):
-        if no1 == None:
-            no1 = self.__hwp.oN
-        if ne1 == None:
-            ne1 = self.__hwp.eN
-        if no2 == None:
-            no2 = self.__hwp.oN
-        if ne2 == None:
-            ne2 = self.__hwp.eN
-        if d == None:
-            d = self.__hwp.thickIdeal
-
-        return self.__M1(nu,no1,ne1)*self.__M2inv(nu,theta,no2,ne2,d)
-
-    def __M(self, nu, thetaArr=None, no=None, ne=None, d=None):
-        if thetaArr == None:
-            thetaArr = self.__hwp.interfaceAngles_3[1:]
-        if no == None:
-            no = self.__hwp.oN
-        if ne == None:
-            ne = self.__hwp.eN
-        if d == None:
-            d = self.__hwp.thickIdeal
-
-        mRet = np.matrix([[1.,0.,0.,0.],[0.,1.,0.,0.],[0.,0.,1.,0.],[0.,0.,0.,1.]])
+        Co = f["Co"]; Ce = f["Ce"]
+        Po = f["Po"]; Pe = f["Pe"]
+        mPo = f["mPo"]; mPe = f["mPe"]
+        M2invRet = 0.5*np.array([[Po*np.cos(theta),   Po*np.sin(theta),  -Po*np.sin(theta)/Co, Po*np.cos(theta)/Co],
+                                 [-Pe*np.sin(theta),  Pe*np.cos(theta),  -Pe*np.cos(theta)/Ce, -Pe*np.sin(theta)/Ce],
+                                 [mPo*np.cos(theta),  mPo*np.sin(theta), mPo*np.sin(theta)/Co, -mPo*np.cos(theta)/Co],
+                                 [-mPe*np.sin(theta), mPe*np.cos(theta), mPe*np.cos(theta)/Ce, mPe*np.sin(theta)/Ce]])
+        return np.moveaxis(M2invRet, (0, 1), (-2, -1))
+
+    def __M(self, f, thetaArr):
+        M1 = self.__M1(f)
+        mRet = np.tile(np.identity(4, dtype=np.complex128), f["CC"].shape+(1,1))
         for i in range(len(thetaArr)):
-            mRet = mRet*self.__m(nu,thetaArr[i],no,ne,d)
+            mRet = np.matmul(mRet, np.matmul(M1, self.__M2inv(f, thetaArr[i])))
         return mRet
 
-    def __Atilde(self, nu, thetaArr=None, no=None, ne=None, d=None):
-        if thetaArr == None:
-            thetaArr = self.__hwp.interfaceAngles_3[1:]
-        if no == None:
-            no = self.__hwp.oN
-        if ne == None:
-            ne = self.__hwp.eN
-        if d == None:
-            d = self.__hwp.thickIdeal
+    def __Atilde(self, f, thetaArr):
+        CC = f["CC"][...,np.newaxis]
+        mm = self.__M(f, thetaArr)
+        return np.stack([mm[...,0]+CC*mm[...,3], mm[...,1]-CC*mm[...,2]], axis=-1)
 
-        CC = self.__Clamb(nu, 1.)
-        mm = self.__M(nu,thetaArr,no,ne,d)
-        AtildeRet =  np.matrix([[mm.item(0,0)+CC*mm.item(0,3), mm.item(0,1)-CC*mm.item(0,2)],
-                                [mm.item(1,0)+CC*mm.item(1,3), mm.item(1,1)-CC*mm.item(1,2)],
-                                [mm.item(2,0)+CC*mm.item(2,3), mm.item(2,1)-CC*mm.item(2,2)],
-                                [mm.item(3,0)+CC*mm.item(3,3), mm.item(3,1)-CC*mm.item(3,2)]])
-        return AtildeRet
-
-    def __Binv(self, nu, theta1, no=None, ne=None):
-        if no == None:
-            no = self.__hwp.oN
-        if ne == None:
-            ne = self.__hwp.eN
-
-        CC = self.__Clamb(nu, 1.)
+    def __Binv(self, f, theta1):
+        CC = f["CC"]
         theta1 = self.__ph.degToRad(theta1)
-        BinvRet = 0.5*np.matrix([[np.cos(theta1),  np.sin(theta1), -np.sin(theta1)/CC, np.cos(theta1)/CC],
-                                 [-np.sin(theta1), np.cos(theta1), -np.cos(theta1)/CC, -np.sin(theta1)/CC],
-                                 [np.cos(theta1),  np.sin(theta1), np.sin(theta1)/CC,  -np.cos(theta1)/CC],
-                                 [-np.sin(theta1), np.cos(theta1), np.cos(theta1)/CC,  np.sin(theta1)/CC]])
-        return BinvRet
-
-    def __a(self, nu, thetaArr=None, no=None, ne=None, d=None):
-        if thetaArr == None:
-            thetaArr = self.__hwp.interfaceAngles_3
-        if no == None:
-            no = self.__hwp.oN
-        if ne == None:
-            ne = self.__hwp.eN
-        if d == None:
-            d = self.__hwp.thickIdeal
-
-        aRet = self.__Binv(nu, thetaArr[0], no, ne)*self.__Atilde(nu, thetaArr[1:], no, ne, d)
-        return aRet
+        c = np.cos(theta1)*np.ones(CC.shape)
+        s = np.sin(theta1)*np.ones(CC.shape)
+        BinvRet = 0.5*np.array([[c,  s, -s/CC, c/CC],
+                                [-s, c, -c/CC, -s/CC],
+                                [c,  s, s/CC,  -c/CC],
+                                [-s, c, c/CC,  s/CC]])
+        return np.moveaxis(BinvRet, (0, 1), (-2, -1))
+
+    def __a(self, f, thetaArr):
+        return np.matmul(self.__Binv(f, thetaArr[0]), self.__Atilde(f, thetaArr[1:]))
+
+    def __r(self, f, thetaArr):
+        aa = self.__a(f, thetaArr)
+        det = aa[...,1,1]*aa[...,0,0] - aa[...,0,1]*aa[...,1,0]
+        rRet = np.array([[(aa[...,1,1]*aa[...,2,0]-aa[...,2,1]*aa[...,1,0])/det, (aa[...,0,0]*aa[...,2,1]-aa[...,2,0]*aa[...,0,1])/det],
+                         [(aa[...,3,0]*aa[...,1,1]-aa[...,3,1]*aa[...,1,0])/det, (aa[...,3,1]*aa[...,0,0]-aa[...,3,0]*aa[...,0,1])/det]])
+        return np.moveaxis(rRet, (0, 1), (-2, -1))
+
+    def __t(self, f, thetaArr):
+        aa = self.__a(f, thetaArr)
+        det = aa[...,1,1]*aa[...,0,0] - aa[...,0,1]*aa[...,1,0]
+        tRet = np.array([[ aa[...,1,1]/det, -aa[...,0,1]/det],
+                         [-aa[...,1,0]/det,  aa[...,0,0]/det]])
+        return np.moveaxis(tRet, (0, 1), (-2, -1))
+
+    #Mueller matrix from a Jones transmission matrix
+    def __mueller(self, tt):
+        ts = np.conj(tt)
+        TRet = 0.5*np.array([[tt[...,0,0]*ts[...,0,0] + tt[...,1,0]*ts[...,1,0] + tt[...,0,1]*ts[...,0,1] + tt[...,1,1]*ts[...,1,1],
+                              tt[...,0,0]*ts[...,0,0] + tt[...,1,0]*ts[...,1,0] - tt[...,0,1]*ts[...,0,1] - tt[...,1,1]*ts[...,1,1],
+                              tt[...,0,0]*ts[...,0,1] + tt[...,1,0]*ts[...,1,1] + tt[...,0,1]*ts[...,0,0] + tt[...,1,1]*ts[...,1,0],
+                              (1./1j)*(tt[...,0,0]*ts[...,0,1] + tt[...,1,0]*ts[...,1,1] - tt[...,0,1]*ts[...,0,0] - tt[...,1,1]*ts[...,1,0])],
+
+                             [tt[...,0,0]*ts[...,0,0] - tt[...,1,0]*ts[...,1,0] + tt[...,0,1]*ts[...,0,1] - tt[...,1,1]*ts[...,1,1],
+                              tt[...,0,0]*ts[...,0,0] - tt[...,1,0]*ts[...,1,0] - tt[...,0,1]*ts[...,0,1] + tt[...,1,1]*ts[...,1,1],
+                              tt[...,0,1]*ts[...,0,0] - tt[...,1,1]*ts[...,1,0] + tt[...,0,0]*ts[...,0,1] - tt[...,1,0]*ts[...,1,1],
+                              (1./1j)*(tt[...,0,1]*ts[...,0,0] - tt[...,1,1]*ts[...,1,0] - tt[...,0,0]*ts[...,0,1] + tt[...,1,0]*ts[...,1,1])],
+
+                             [tt[...,0,0]*ts[...,1,0] + tt[...,1,0]*ts[...,0,0] + tt[...,0,1]*ts[...,1,1] + tt[...,1,1]*ts[...,0,1],
+                              tt[...,0,0]*ts[...,1,0] + tt[...,1,0]*ts[...,0,0] - tt[...,0,1]*ts[...,1,1] - tt[...,1,1]*ts[...,0,1],
+                              tt[...,0,0]*ts[...,1,1] + tt[...,1,0]*ts[...,0,1] + tt[...,0,1]*ts[...,1,0] + tt[...,1,1]*ts[...,0,0],
+                              (1./1j)*(tt[...,0,0]*ts[...,1,1] + tt[...,1,0]*ts[...,0,1] - tt[...,0,1]*ts[...,1,0] - tt[...,1,1]*ts[...,0,0])],
+
+                             [1j*(tt[...,0,0]*ts[...,1,0] - tt[...,1,0]*ts[...,0,0] + tt[...,0,1]*ts[...,1,1] - tt[...,1,1]*ts[...,0,1]),
+                              1j*(tt[...,0,0]*ts[...,1,0] - tt[...,1,0]*ts[...,0,0] - tt[...,0,1]*ts[...,1,1] + tt[...,1,1]*ts[...,0,1]),
+                              1j*(tt[...,0,0]*ts[...,1,1] - tt[...,1,0]*ts[...,0,1] + tt[...,0,1]*ts[...,1,0] - tt[...,1,1]*ts[...,0,0]),
+                              tt[...,0,0]*ts[...,1,1] - tt[...,1,0]*ts[...,0,1] - tt[...,0,1]*ts[...,1,0] + tt[...,1,1]*ts[...,0,0]]])
+        #The imaginary parts cancel, leaving a real Mueller matrix
+        return np.real(np.moveaxis(TRet, (0, 1), (-2, -1)))
 
-    def __r(self, nu, thetaArr=None, no=None, ne=None, d=None):
-        if thetaArr == None:
+    #***** Public functions *****
+    #Jones reflection matrix for an ideal HWP, shape nu.shape + (2, 2)
+    def r(self, nu, thetaArr=None, no=None, ne=None, d=None):
+        if thetaArr is None:
             thetaArr = self.__hwp.interfaceAngles_3
-        if no == None:
-            no = self.__hwp.oN
-        if ne == None:
-            ne = self.__hwp.eN
-        if d == None:
+        if no is None:
+            no = self.__sp.oN
+        if ne is None:
+            ne = self.__sp.eN
+        if d is None:
             d = self.__hwp.thickIdeal
 
-        aa = self.__a(nu, thetaArr, no, ne, d)
-        return np.matrix([[(aa.item(1,1)*aa.item(2,0)-aa.item(2,1)*aa.item(1,0))/(aa.item(1,1)*aa.item(0,0) - aa.item(0,1)*aa.item(1,0)), 
-                           (aa.item(0,0)*aa.item(2,1)-aa.item(2,0)*aa.item(0,1))/(aa.item(1,1)*aa.item(0,0) - aa.item(0,1)*aa.item(1,0))],
-                          [(aa.item(3,0)*aa.item(1,1)-aa.item(3,1)*aa.item(1,0))/(aa.item(1,1)*aa.item(0,0) - aa.item(0,1)*aa.item(1,0)), 
-                           (aa.item(3,1)*aa.item(0,0)-aa.item(3,0)*aa.item(0,1))/(aa.item(1,1)*aa.item(0,0) - aa.item(0,1)*aa.item(1,0))]])
+        nuArr = np.atleast_1d(np.asarray(nu, dtype=np.float64))
+        return self.__r(self.__factors(nuArr, no, ne, d), thetaArr).reshape(np.shape(nu)+(2,2))
 
-    def __t(self, nu, thetaArr=None, no=None, ne=None, d=None):
-        if thetaArr == None:
+    #Jones transmission matrix for an ideal HWP, shape nu.shape + (2, 2)
+    def t(self, nu, thetaArr=None, no=None, ne=None, d=None):
+        if thetaArr is None:
             thetaArr = self.__hwp.interfaceAngles_3
-        if no == None:
-            no = self.__hwp.oN
-        if ne == None:
-            ne = self.__hwp.eN
-        if d == None:
+        if no is None:
+            no = self.__sp.oN
+        if ne is None:
+            ne = self.__sp.eN
+        if d is None:
             d = self.__hwp.thickIdeal
 
-        aa = self.__a(nu, thetaArr, no, ne, d)
-        return np.matrix([[ aa.item(1,1)/(aa.item(1,1)*aa.item(0,0)-aa.item(0,1)*aa.item(1,0)), 
-                            -aa.item(0,1)/(aa.item(1,1)*aa.item(0,0)-aa.item(0,1)*aa.item(1,0))],
-                          [-aa.item(1,0)/(aa.item(1,1)*aa.item(0,0)-aa.item(0,1)*aa.item(1,0)), 
-                            aa.item(0,0)/(aa.item(1,1)*aa.item(0,0)-aa.item(0,1)*aa.item(1,0))]])
-    
-    #***** Public functions *****
-    #Transfer matrix for an ideal HWP
+        nuArr = np.atleast_1d(np.asarray(nu, dtype=np.float64))
+        return self.__t(self.__factors(nuArr, no, ne, d), thetaArr).reshape(np.shape(nu)+(2,2))
+
+    #Transfer matrix for an ideal HWP, shape nu.shape + (4, 4)
     def T(self, nu, thetaArr=None, no=None, ne=None, d=None):
-        if thetaArr == None:
+        return self.__mueller(self.t(nu, thetaArr, no, ne, d))
+
+    #Output Stokes vector for an ideal HWP, for an input polarization angle alpha [deg] and with the HWP angle rho [deg]
+    #added to the first interface angle, shape nu.shape + (4,)
+    def Sout(self, alpha, nu, rho, thetaArr=None, P=1.):
+        if thetaArr is None:
             thetaArr = self.__hwp.interfaceAngles_3
-        if no == None:
-            no = self.__hwp.oN
-        if ne == None:
-            ne = self.__hwp.eN
-        if d == None:
-            d = self.__hwp.thickIdeal
+        thetaArr = np.array(thetaArr, dtype=np.float64)
+        thetaArr[0] = thetaArr[0] + rho
 
-        tt = self.__t(nu, thetaArr, no=oN, ne=eN, d=singleThk)
-        ts = np.conj(tt)
-        return 0.5*np.matrix([[tt.item(0,0)*ts.item(0,0) + tt.item(1,0)*ts.item(1,0) + tt.item(0,1)*ts.item(0,1) + tt.item(1,1)*ts.item(1,1),
-                               tt.item(0,0)*ts.item(0,0) + tt.item(1,0)*ts.item(1,0) - tt.item(0,1)*ts.item(0,1) - tt.item(1,1)*ts.item(1,1),
-                               tt.item(0,0)*ts.item(0,1) + tt.item(1,0)*ts.item(1,1) + tt.item(0,1)*ts.item(0,0) + tt.item(1,1)*ts.item(1,0),
-                               (1./1j)*(tt.item(0,0)*ts.item(0,1) + tt.item(1,0)*ts.item(1,1) - tt.item(0,1)*ts.item(0,0) - tt.item(1,1)*ts.item(1,0))],
-                              
-                              [tt.item(0,0)*ts.item(0,0) - tt.item(1,0)*ts.item(1,0) + tt.item(0,1)*ts.item(0,1) - tt.item(1,1)*ts.item(1,1),
-                               tt.item(0,0)*ts.item(0,0) - tt.item(1,0)*ts.item(1,0) - tt.item(0,1)*ts.item(0,1) + tt.item(1,1)*ts.item(1,1),
-                               tt.item(0,1)*ts.item(0,0) - tt.item(1,1)*ts.item(1,0) + tt.item(0,0)*ts.item(0,1) - tt.item(1,0)*ts.item(1,1),
-                               (1./1j)*(tt.item(0,1)*ts.item(0,0) - tt.item(1,1)*ts.item(1,0) - tt.item(0,0)*ts.item(0,1) + tt.item(1,0)*ts.item(1,1))],
-                              
-                              [tt.item(0,0)*ts.item(1,0) + tt.item(1,0)*ts.item(0,0) + tt.item(0,1)*ts.item(1,1) + tt.item(1,1)*ts.item(0,1),
-                               tt.item(0,0)*ts.item(1,0) + tt.item(1,0)*ts.item(0,0) - tt.item(0,1)*ts.item(1,1) - tt.item(1,1)*ts.item(0,1),
-                               tt.item(0,0)*ts.item(1,1) + tt.item(1,0)*ts.item(0,1) + tt.item(0,1)*ts.item(1,0) + tt.item(1,1)*ts.item(0,0),
-                               (1./1j)*(tt.item(0,0)*ts.item(1,1) + tt.item(1,0)*ts.item(0,1) - tt.item(0,1)*ts.item(1,0) - tt.item(1,1)*ts.item(0,0))],
-                              
-                              [1j*(tt.item(0,0)*ts.item(1,0) - tt.item(1,0)*ts.item(0,0) + tt.item(0,1)*ts.item(1,1) - tt.item(1,1)*ts.item(0,1)),
-                               1j*(tt.item(0,0)*ts.item(1,0) - tt.item(1,0)*ts.item(0,0) - tt.item(0,1)*ts.item(1,1) + tt.item(1,1)*ts.item(0,1)),
-                               1j*(tt.item(0,0)*ts.item(1,1) - tt.item(1,0)*ts.item(0,1) + tt.item(0,1)*ts.item(1,0) - tt.item(1,1)*ts.item(0,0)),
-                               tt.item(0,0)*ts.item(1,1) - tt.item(1,0)*ts.item(0,1) - tt.item(0,1)*ts.item(1,0) + tt.item(1,1)*ts.item(0,0)]])
-    
-    #Output Stokes vector for an ideal HWP
-    def Sout(self, alpha, nu, rho, P=1.):
-        return self.T(nu,angles)*self.__ph.Stokes(P,alpha)
+        S = self.__ph.Stokes(P, alpha)
+        return np.einsum('...ij,j->...i', self.T(nu, thetaArr), S)
@@ -7,6 +7,10 @@ import pickle as pkl
 import scipy.integrate as itg
 import copy
 
+#Custom classes
+from src.physics import Physics
+from src.hwp     import HWP
+
 #Class to calculate transmission through arbitrary stack
 #Method taken from Tom Essinger-Hileman's paper from 2014
 #"Transfer matrix for treating stratified media including birefringent crystals"
@@ -46,89 +50,184 @@ class Tom:
     def __sq(self, arg):
         return np.power(arg, 2.)
 
+    #Propagation matrices for one birefringent layer at an array of plate orientations chi, returned as the
+    #frequency-independent outer products (Psi*Phi, Phi^-1*Psi^-1), each of shape chi.shape + (4, 4), and the
+    #two optical path lengths. The ordinary path length does not depend on chi and is calculated once
+    def __layer(self, no, ne, oLT, eLT, t, chi, theta1, n1):
+        chi = np.asarray(chi, dtype=np.float64)
+
+        #Ordinary wave
+        nP = no
+        nPT = nP*np.sqrt(1-1j*oLT)
+        thetaP = self.__rd(np.arcsin(n1*self.__sin(theta1)/nP))
+        deltaP = nPT*t*self.__cos(thetaP)
+        cP = self.__cos(thetaP); sP = self.__sin(thetaP)
+
+        #Extraordinary wave, which only depends on the plate orientation away from normal incidence
+        cC = self.__cos(chi); sC = self.__sin(chi)
+        nPP = ne*np.sqrt(1+(self.__pow(ne,-2)-self.__pow(no,-2))*self.__sq(n1)*self.__sq(self.__sin(theta1))*self.__sq(cC))
+        if eLT == oLT:
+            LTpp = oLT
+        else:
+            LTpp = oLT + ((eLT - oLT)/(ne - no))*(nPP - no)
+        nPPT = nPP*np.sqrt(1-1j*LTpp)
+        thetaPP = self.__rd(np.arcsin(n1*self.__sin(theta1)/nPP))
+        deltaPP = nPPT*t*self.__cos(thetaPP)
+        cPP = self.__cos(thetaPP); sPP = self.__sin(thetaPP); cD = self.__cos(thetaP-thetaPP)
+
+        #In-plane block of R(chi) diag(a, b) R(-chi), which gives the permittivity for (a, b) = (ne^2, no^2) and its inverse for (ne^-2, no^-2)
+        def rotated(a, b):
+            return a*self.__sq(cC)+b*self.__sq(sC), (a-b)*cC*sC, a*self.__sq(sC)+b*self.__sq(cC)
+
+        #Field vectors
+        DPt1 = self.__pow(self.__sq(cP)+self.__sq(sP)*self.__sq(sC),-0.5)*np.array([-sC*cP, cC*cP, sC*sP])
+        DPPt1 = self.__pow(self.__sq(cC)*self.__sq(cP)+self.__sq(sC)*self.__sq(cD),-0.5)*np.array([cC*cP*cPP, sC*(sP*sPP+cP*cPP), -cC*cP*sPP])
+        HPt1 = self.__pow(self.__sq(cP)*self.__sq(cC)+self.__sq(sC),-0.5)*np.array([-self.__sq(cP)*cC, -sC, cP*sP*cC])
+        HPPt1 = self.__pow(self.__sq(cD)*self.__sq(sC)+self.__sq(cP)*self.__sq(cC),-0.5)*np.array([-cD*cPP*sC, cP*cC, cD*sPP*sC])
+
+        Phi1 = np.empty(chi.shape+(4, 4))
+        Phi1[...,0,:] = np.stack([DPt1[0], DPPt1[0], DPt1[0], DPPt1[0]], axis=-1)
+        Phi1[...,1,:] = np.stack([(1./nP)*HPt1[1], (1./nPP)*HPPt1[1], (-1./nP)*HPt1[1], (-1./nPP)*HPPt1[1]], axis=-1)
+        Phi1[...,2,:] = np.stack([DPt1[1], DPPt1[1], DPt1[1], DPPt1[1]], axis=-1)
+        Phi1[...,3,:] = np.stack([(-1./nP)*HPt1[0], (-1./nPP)*HPPt1[0], (1./nP)*HPt1[0], (1./nPP)*HPPt1[0]], axis=-1)
+        #Psi and its inverse, which holds the permittivity in place of its inverse, as the rotation is about the z-axis
+        Psi1 = np.zeros(chi.shape+(4, 4)); Psi1inv = np.zeros(chi.shape+(4, 4))
+        for Psi, (e00, e01, e11) in [(Psi1, rotated(self.__pow(ne,-2), self.__pow(no,-2))), (Psi1inv, rotated(self.__sq(ne), self.__sq(no)))]:
+            Psi[...,0,0] = e00; Psi[...,0,2] = e01; Psi[...,2,0] = e01; Psi[...,2,2] = e11
+            Psi[...,1,1] = 1.; Psi[...,3,3] = 1.
+
+        return np.matmul(Psi1, Phi1), np.matmul(self.__inv(Phi1), Psi1inv), deltaP, deltaPP
+
+    #Jones transmission and reflection matrices from a stack transfer matrix with arbitrary leading axes
+    def __jones(self, T, n1, n3, theta1, theta3):
+        #Transmission coefficients
+        alphaT = (T[...,0,0]*self.__cos(theta3)+T[...,0,1]*n3)/self.__cos(theta1)
+        betaT = (T[...,0,2]+T[...,0,3]*n3*self.__cos(theta3))/self.__cos(theta1)
+        gammaT = (T[...,1,0]*self.__cos(theta3)+T[...,1,1]*n3)/n1
+        deltaT = (T[...,1,2]+T[...,1,3]*n3*self.__cos(theta3))/n1
+        etaT = (T[...,2,0]*self.__cos(theta3)+T[...,2,1]*n3)
+        kappaT = (T[...,2,2]+T[...,2,3]*n3*self.__cos(theta3))
+        rhoT = (T[...,3,0]*self.__cos(theta3)+T[...,3,1]*n3)/(n1*self.__cos(theta1))
+        sigmaT = (T[...,3,2]+T[...,3,3]*n3*self.__cos(theta3))/(n1*self.__cos(theta1))
+        GammaT = self.__pow((alphaT+gammaT)*(kappaT+sigmaT)-(betaT+deltaT)*(etaT+rhoT),-1.)
+
+        #Jones Transmission and Reflection Matrices
+        JT = np.empty(T.shape[:-2]+(2, 2), dtype=np.complex128)
+        JT[...,0,0] = 2.*GammaT*(kappaT+sigmaT)
+        JT[...,0,1] = 2.*GammaT*(-betaT-deltaT)
+        JT[...,1,0] = 2.*GammaT*(-etaT-rhoT)
+        JT[...,1,1] = 2.*GammaT*(alphaT+gammaT)
+        JR = np.empty(T.shape[:-2]+(2, 2), dtype=np.complex128)
+        JR[...,0,0] = GammaT*((gammaT-alphaT)*(kappaT+sigmaT)-(deltaT-betaT)*(etaT+rhoT))
+        JR[...,0,1] = GammaT*2.*(alphaT*deltaT-gammaT*betaT)
+        JR[...,1,0] = GammaT*2.*(etaT*sigmaT-rhoT*kappaT)
+        JR[...,1,1] = GammaT*((alphaT+gammaT)*(kappaT-sigmaT)-(betaT+deltaT)*(etaT-rhoT))
+
+        return JT, JR
+
+    #Stokes vectors from (P, S) electric field amplitudes
+    def __stokes(self, E):
+        Ep = E[...,0]
+        Es = E[...,1]
+        return np.stack([self.__sq(np.abs(Ep))+self.__sq(np.abs(Es)),
+                         self.__sq(np.abs(Ep))-self.__sq(np.abs(Es)),
+                         2.*np.real(Ep*np.conj(Es)),
+                         -2.*np.imag(Ep*np.conj(Es))], axis=-1)
+
     #Transfer function for stratified medium
     def TransMat(self, nu, noArr, neArr, oLTArr, eLTArr, tArr, chiArr, rho, incAngle, incN):
+        return np.matrix(self.TransMatArr(np.array([nu]), noArr, neArr, oLTArr, eLTArr, tArr, chiArr, rho, incAngle, incN)[0])
+
+    #Transfer function for stratified medium over an array of frequencies, shape (freqs, 4, 4)
+    def TransMatArr(self, nuArr, noArr, neArr, oLTArr, eLTArr, tArr, chiArr, rho, incAngle, incN):
         #First medium is air
         theta1 = incAngle
         n1 = incN
-    
+
+        #Vacuum wavevector
+        nuArr = np.asarray(nuArr, dtype=np.float64)
+        k0 = (2*np.pi)/(self.__ph.c/nuArr)
+
         #Create transfer matrix
-        Tr = np.identity(4)
+        Tr = np.tile(np.identity(4, dtype=np.complex128), (len(nuArr), 1, 1))
         #Return the identity matrix if no layers are to be calculated
         if len(noArr) == 0:
             return Tr
         #Loop over the HWP layers
         for i in range(len(chiArr)):
-            #Physical values for this layer
-            no = noArr[i]
-            ne = neArr[i]
-            oLT = oLTArr[i]
-            eLT = eLTArr[i]
-            t = tArr[i]
-            chi = chiArr[i]+rho #Plate orientation w.r.t x-axis
-            
-            #Vacuum wavevector
-            k0 = (2*np.pi)/(self.__ph.c/nu)
-            
-            nP = no
-            nPP = ne*np.sqrt(1+(self.__pow(ne,-2)-self.__pow(no,-2))*self.__sq(n1)*self.__sq(self.__sin(theta1))*self.__sq(self.__cos(chi)))
-        
-            R = lambda chi: np.matrix([[self.__cos(chi),-self.__sin(chi),0],[self.__sin(chi),self.__cos(chi),0],[0,0,1]])
-            epsilonP = R(chi)*np.matrix([[self.__sq(ne),0,0],[0,self.__sq(no),0],[0,0,self.__sq(no)]])*R(-chi)
-        
-            LTp = oLT
-            nPT = nP*np.sqrt(1-1j*LTp)
-            
-            if eLT == oLT:
-                LTpp = oLT
-            else:
-                LTpp = oLT + ((eLT - oLT)/(ne - no))*(nPP - no)
-            nPPT = nPP*np.sqrt(1-1j*LTpp)
-            
-            thetaP = self.__rd(np.arcsin(n1*self.__sin(theta1)/nP))
-            thetaPP = self.__rd(np.arcsin(n1*self.__sin(theta1)/nPP))
-            
-            deltaP = nPT*t*self.__cos(thetaP)
-            deltaPP = nPPT*t*self.__cos(thetaPP)
-            
-            DPt1 = self.__pow(self.__sq(self.__cos(thetaP))+self.__sq(self.__sin(thetaP))*self.__sq(self.__sin(chi)),-0.5)*np.array([-self.__sin(chi)*self.__cos(thetaP),self.__cos(chi)*self.__cos(thetaP),self.__sin(chi)*self.__sin(thetaP)])
-            DPPt1 = self.__pow(self.__sq(self.__cos(chi))*self.__sq(self.__cos(thetaP))+self.__sq(self.__sin(chi))*self.__sq(self.__cos(thetaP-thetaPP)),-0.5)*np.array([self.__cos(chi)*self.__cos(thetaP)*self.__cos(thetaPP),self.__sin(chi)*(self.__sin(thetaP)*self.__sin(thetaPP)+self.__cos(thetaP)*self.__cos(thetaPP)),-self.__cos(chi)*self.__cos(thetaP)*self.__sin(thetaPP)])
-            HPt1 = self.__pow(self.__sq(self.__cos(thetaP))*self.__sq(self.__cos(chi))+self.__sq(self.__sin(chi)),-0.5)*np.array([-self.__sq(self.__cos(thetaP))*self.__cos(chi),-self.__sin(chi),self.__cos(thetaP)*self.__sin(thetaP)*self.__cos(chi)])
-            HPPt1 = self.__pow(self.__sq(self.__cos(thetaP-thetaPP))*self.__sq(self.__sin(chi))+self.__sq(self.__cos(thetaP))*self.__sq(self.__cos(chi)),-0.5)*np.array([-self.__cos(thetaP-thetaPP)*self.__cos(thetaPP)*self.__sin(chi),self.__cos(thetaP)*self.__cos(chi),self.__cos(thetaP-thetaPP)*self.__sin(thetaPP)*self.__sin(chi)])
-        
-            Phi1 = np.matrix([[DPt1.item(0),DPPt1.item(0),DPt1.item(0),DPPt1.item(0)],[(1./nP)*HPt1.item(1),(1./nPP)*HPPt1.item(1),(-1./nP)*HPt1.item(1),(-1./nPP)*HPPt1.item(1)],[DPt1.item(1),DPPt1.item(1),DPt1.item(1),DPPt1.item(1)],[(-1./nP)*HPt1.item(0),(-1./nPP)*HPPt1.item(0),(1./nP)*HPt1.item(0),(1./nPP)*HPPt1.item(0)]])
-            Psi1 = np.matrix([[self.__inv(epsilonP).item(0,0),0,self.__inv(epsilonP).item(0,1),0],[0,1.,0,0],[self.__inv(epsilonP).item(1,0),0,self.__inv(epsilonP).item(1,1),0],[0,0,0,1.]])
+            #Plate orientation w.r.t x-axis
+            chi = chiArr[i]+rho
+            PsiPhi, PhiPsiInv, deltaP, deltaPP = self.__layer(noArr[i], neArr[i], oLTArr[i], eLTArr[i], tArr[i], chi, theta1, n1)
+
+            #Diagonal of the inverse propagation matrix for every frequency
             DeltaP = 1j*k0*deltaP
             DeltaPP = 1j*k0*deltaPP
-            P = np.matrix([[np.exp(-DeltaP),0,0,0],[0,np.exp(-DeltaPP),0,0],[0,0,np.exp(DeltaP),0],[0,0,0,np.exp(DeltaPP)]])
-        
+            Pinv = np.stack([np.exp(DeltaP), np.exp(DeltaPP), np.exp(-DeltaP), np.exp(-DeltaPP)], axis=-1)
+
             #Store the transfer matrix fragment into an array
-            Tr = Psi1*Phi1*self.__inv(P)*self.__inv(Phi1)*self.__inv(Psi1)*Tr
-        
+            Tr = np.matmul(np.matmul(PsiPhi*Pinv[:,np.newaxis,:], PhiPsiInv), Tr)
+
         #Return the transfer matrix
         return Tr
 
-    #Transmission through dielectric layers
-    def trans(self, nuArr, noArr=None, neArr=None, oLTArr=None, eLTArr=None, tArr=None, chiArr=None, rho=None, incAng=None, polAng=None):
-        if noArr == None:
+    #Transfer function for stratified medium over a grid of HWP angles and frequencies, shape (rhos, freqs, 4, 4)
+    def TransMatRho(self, nuArr, rhoArr, noArr, neArr, oLTArr, eLTArr, tArr, chiArr, incAngle, incN):
+        #First medium is air
+        theta1 = incAngle
+        n1 = incN
+
+        #Vacuum wavevector
+        nuArr = np.asarray(nuArr, dtype=np.float64)
+        rhoArr = np.asarray(rhoArr, dtype=np.float64)
+        k0 = (2*np.pi)/(self.__ph.c/nuArr)
+
+        #Create transfer matrix
+        Tr = np.tile(np.identity(4, dtype=np.complex128), (len(rhoArr), len(nuArr), 1, 1))
+        #Return the identity matrix if no layers are to be calculated
+        if len(noArr) == 0:
+            return Tr
+        #Loop over the HWP layers
+        for i in range(len(chiArr)):
+            #Only the plate orientation w.r.t x-axis changes with the HWP angle, so the layer matrices of every angle are built together
+            PsiPhi, PhiPsiInv, deltaP, deltaPP = self.__layer(noArr[i], neArr[i], oLTArr[i], eLTArr[i], tArr[i], chiArr[i]+rhoArr, theta1, n1)
+            deltaPP = np.broadcast_to(deltaPP, rhoArr.shape)
+
+            #The extraordinary path length only depends on the HWP angle away from normal incidence,
+            #so otherwise the propagation factors are calculated once and shared by every angle
+            if np.all(deltaPP == deltaPP[0]):
+                deltaPP = deltaPP[:1]
+            DeltaP = 1j*k0*deltaP
+            DeltaPP = 1j*k0[np.newaxis,:]*deltaPP[:,np.newaxis]
+            DeltaP = np.broadcast_to(DeltaP, DeltaPP.shape)
+            Pinv = np.stack([np.exp(DeltaP), np.exp(DeltaPP), np.exp(-DeltaP), np.exp(-DeltaPP)], axis=-1)
+
+            #Store the transfer matrix fragment into an array
+            Tr = np.matmul(np.matmul(PsiPhi[:,np.newaxis]*Pinv[:,:,np.newaxis,:], PhiPsiInv[:,np.newaxis]), Tr)
+
+        #Return the transfer matrix
+        return Tr
+
+    #Jones matrices and powers for transmission and reflection through dielectric layers, evaluating the stack once per frequency
+    def transJones(self, nuArr, noArr=None, neArr=None, oLTArr=None, eLTArr=None, tArr=None, chiArr=None, rho=None, incAng=None, polAng=None):
+        if noArr is None:
             noArr = self.__hwp.noArr
-        if neArr == None:
+        if neArr is None:
             neArr = self.__hwp.neArr
-        if oLTArr == None:
+        if oLTArr is None:
             oLTArr = self.__hwp.oltArr
-        if eLTArr == None:
+        if eLTArr is None:
             eLTArr = self.__hwp.eltArr
-        if tArr == None:
+        if tArr is None:
             tArr = self.__hwp.dArr
-        if chiArr == None:
+        if chiArr is None:
             chiArr = self.__hwp.plateAngles
-        if rho == None:
+        if rho is None:
             rho = self.__defHWPAng
-        if incAng == None:
+        if incAng is None:
             incAng = self.__defIncAng
-        if polAng == None:
+        if polAng is None:
             polAng = self.__defPolAng
-        
+
         #Check array integrity
         if not (len(chiArr) == len(noArr) == len(neArr) == len(tArr) == len(oLTArr) == len(eLTArr)):
             raise NameError("Length of 'anisotropicTransmission' arrays need to be the same")
@@ -138,75 +237,96 @@ class Tom:
         #Cannot calculate birefringence in first layer, so take average index
         n1 = (noArr[0] + neArr[0])/2.
         theta1 = incAng
-        
-        #Create transfer matrix for this stack
-        T = lambda nu: self.TransMat(nu, noArr[1:-1], neArr[1:-1], oLTArr[1:-1], eLTArr[1:-1], tArr[1:-1], chiArr[1:-1], rho, incAng, n1)
-        
+
+        #Transfer matrix for this stack at every frequency
+        T = self.TransMatArr(nuArr, noArr[1:-1], neArr[1:-1], oLTArr[1:-1], eLTArr[1:-1], tArr[1:-1], chiArr[1:-1], rho, incAng, n1)
+
         #Cannot calculate birefringence in final layer, so take average index
         n3 = (noArr[-1] + neArr[-1])/2.
         theta3 = self.__rd(np.arcsin((n1/n3)*self.__sin(theta1)))
-        
-        #Transmission coefficients
-        alphaT = lambda nu: (T(nu).item(0,0)*self.__cos(theta3)+T(nu).item(0,1)*n3)/self.__cos(theta1)
-        betaT = lambda nu: (T(nu).item(0,2)+T(nu).item(0,3)*n3*self.__cos(theta3))/self.__cos(theta1)
-        gammaT = lambda nu: (T(nu).item(1,0)*self.__cos(theta3)+T(nu).item(1,1)*n3)/n1
-        deltaT = lambda nu: (T(nu).item(1,2)+T(nu).item(1,3)*n3*self.__cos(theta3))/n1
-        etaT = lambda nu: (T(nu).item(2,0)*self.__cos(theta3)+T(nu).item(2,1)*n3)
-        kappaT = lambda nu: (T(nu).item(2,2)+T(nu).item(2,3)*n3*self.__cos(theta3))
-        rhoT = lambda nu: (T(nu).item(3,0)*self.__cos(theta3)+T(nu).item(3,1)*n3)/(n1*self.__cos(theta1))
-        sigmaT = lambda nu: (T(nu).item(3,2)+T(nu).item(3,3)*n3*self.__cos(theta3))/(n1*self.__cos(theta1))
-        GammaT = lambda nu: self.__pow((alphaT(nu)+gammaT(nu))*(kappaT(nu)+sigmaT(nu))-(betaT(nu)+deltaT(nu))*(etaT(nu)+rhoT(nu)),-1.)
-        
-        #Jones Transmission and Reflection Matrices
-        JT = lambda nu: 2.*GammaT(nu)*np.matrix(
-            [[(kappaT(nu)+sigmaT(nu)),
-              (-betaT(nu)-deltaT(nu))],
-             [(-etaT(nu)-rhoT(nu)),
-              (alphaT(nu)+gammaT(nu))]]
-            )
-        JR = lambda nu: GammaT(nu)*np.matrix(
-            [[(gammaT(nu)-alphaT(nu))*(kappaT(nu)+sigmaT(nu))-(deltaT(nu)-betaT(nu))*(etaT(nu)+rhoT(nu)),
-              2.*(alphaT(nu)*deltaT(nu)-gammaT(nu)*betaT(nu))],
-             [2.*(etaT(nu)*sigmaT(nu)-rhoT(nu)*kappaT(nu)),
-              (alphaT(nu)+gammaT(nu))*(kappaT(nu)-sigmaT(nu))-(betaT(nu)+deltaT(nu))*(etaT(nu)-rhoT(nu))]]
-            )
-        
+
+        #Jones Transmission and Reflection Matrices, shape (freqs, 2, 2)
+        JT, JR = self.__jones(T, n1, n3, theta1, theta3)
+
         #Incident Electric Field Amplitude
         Ei = np.array([abs(self.__cos(polAng)), abs(self.__sin(polAng))])
-        #Incident Power
-        Pi = np.array([self.__sq(Ei[0]), self.__sq(Ei[1])])
-        
-        #Transmitted Electric Field Amplitude
-        EPT = lambda nu: JT(nu).item(0,0)*Ei[0] + JT(nu).item(0,1)*Ei[1]
-        EST = lambda nu: JT(nu).item(1,0)*Ei[0] + JT(nu).item(1,1)*Ei[1]
-        
-        #Transmitted Power
-        PPT = lambda nu: EPT(nu)*np.conj(EPT(nu))
-        PST = lambda nu: EST(nu)*np.conj(EST(nu))
-
-        #Reflected Electric Field Amplitude
-        EPR = lambda nu: JR(nu).item(0,0)*Ei[0] + JR(nu).item(0,1)*Ei[1]
-        ESR = lambda nu: JR(nu).item(1,0)*Ei[0] + JR(nu).item(1,1)*Ei[1]
-        
-        #Reflected Power
-        PPR = lambda nu: EPR(nu)*np.conj(EPR(nu))
-        PSR = lambda nu: ESR(nu)*np.conj(ESR(nu))
-        
-        #Loop over the frequencies and calculate transmission for each
-        pT = []
-        sT = []
-        pR = []
-        sR = []
-        for nu in nuArr:
-            #print "Analyzing %.1f GHz" % (nu*1.e-9)
-            pT.append(PPT(nu))
-            sT.append(PST(nu))
-            pR.append(PPR(nu))
-            sR.append(PSR(nu))
+
+        #Transmitted and Reflected Electric Field Amplitudes, shape (freqs, 2) as (P, S)
+        ET = np.matmul(JT, Ei)
+        ER = np.matmul(JR, Ei)
+
+        #Transmitted and Reflected Power
+        pT, sT = (np.abs(ET)**2).T
+        pR, sR = (np.abs(ER)**2).T
 
         #Absorbed power
-        pA = 1. - np.array(pT) - np.array(pR)
-        sA = 1. - np.array(sT) - np.array(sR)
-            
+        pA = 1. - pT - pR
+        sA = 1. - sT - sR
+
+        #Return the Jones matrices and the power transmission, reflection, and absorption arrays
+        return JT, JR, pT, sT, pR, sR, pA, sA
+
+    #Jones matrices, Stokes vectors, modulation efficiency, and modulation phase [deg] over a grid of HWP angles [deg] and frequencies
+    def transRho(self, nuArr, rhoArr, noArr=None, neArr=None, oLTArr=None, eLTArr=None, tArr=None, chiArr=None, incAng=None, polAng=None):
+        if noArr is None:
+            noArr = self.__hwp.noArr
+        if neArr is None:
+            neArr = self.__hwp.neArr
+        if oLTArr is None:
+            oLTArr = self.__hwp.oltArr
+        if eLTArr is None:
+            eLTArr = self.__hwp.eltArr
+        if tArr is None:
+            tArr = self.__hwp.dArr
+        if chiArr is None:
+            chiArr = self.__hwp.plateAngles
+        if incAng is None:
+            incAng = self.__defIncAng
+        if polAng is None:
+            polAng = self.__defPolAng
+
+        #Check array integrity
+        if not (len(chiArr) == len(noArr) == len(neArr) == len(tArr) == len(oLTArr) == len(eLTArr)):
+            raise NameError("Length of 'anisotropicTransmission' arrays need to be the same")
+        if not len(nuArr):
+            raise NameError("Length 'nuArr' needs to be non-zero")
+        if not len(rhoArr):
+            raise NameError("Length 'rhoArr' needs to be non-zero")
+
+        #Cannot calculate birefringence in first layer, so take average index
+        n1 = (noArr[0] + neArr[0])/2.
+        theta1 = incAng
+
+        #Transfer matrix for this stack at every HWP angle and frequency
+        T = self.TransMatRho(nuArr, rhoArr, noArr[1:-1], neArr[1:-1], oLTArr[1:-1], eLTArr[1:-1], tArr[1:-1], chiArr[1:-1], incAng, n1)
+
+        #Cannot calculate birefringence in final layer, so take average index
+        n3 = (noArr[-1] + neArr[-1])/2.
+        theta3 = self.__rd(np.arcsin((n1/n3)*self.__sin(theta1)))
+
+        #Jones Transmission and Reflection Matrices, shape (rhos, freqs, 2, 2)
+        JT, JR = self.__jones(T, n1, n3, theta1, theta3)
+
+        #Incident Electric Field Amplitude
+        Ei = np.array([abs(self.__cos(polAng)), abs(self.__sin(polAng))])
+
+        #Transmitted and Reflected Stokes vectors, shape (rhos, freqs, 4)
+        ST = self.__stokes(np.matmul(JT, Ei))
+        SR = self.__stokes(np.matmul(JR, Ei))
+
+        #Modulation efficiency of the intensity transmitted through an x polarizer
+        intensity = 0.5*(ST[...,0] + ST[...,1])
+        modEff = (np.amax(intensity, axis=0) - np.amin(intensity, axis=0))/(np.amax(intensity, axis=0) + np.amin(intensity, axis=0))
+
+        #Modulation phase from a fit of the 4*rho harmonic at every frequency
+        rho4 = 4.*np.array([self.__dr(rho) for rho in rhoArr])
+        A = np.array([np.ones(len(rho4)), np.cos(rho4), np.sin(rho4)]).T
+        coeffs = np.linalg.lstsq(A, intensity, rcond=None)[0]
+        phase = 0.25*self.__rd(np.arctan2(coeffs[2], coeffs[1]))
+
+        return JT, JR, ST, SR, modEff, phase
+
+    #Transmission through dielectric layers
+    def trans(self, nuArr, noArr=None, neArr=None, oLTArr=None, eLTArr=None, tArr=None, chiArr=None, rho=None, incAng=None, polAng=None):
         #Return the power transmission, reflection, and absorption arrays
-        return np.array(pT), np.array(sT), np.array(pR), np.array(sR), np.array(pA), np.array(sA)
+        return self.transJones(nuArr, noArr, neArr, oLTArr, eLTArr, tArr, chiArr, rho, incAng, polAng)[2:]